@@ -0,0 +1,109 @@
+"""
+Runs the pipetools benchmarks (see ``benchmarks/suite.py``).
+
+Usage::
+
+    python benchmarks/run.py                        # run all benchmarks
+    python benchmarks/run.py -k foreach -k where    # only matching ones
+    python benchmarks/run.py --large                # also 1e6 and 1e7 items
+    python benchmarks/run.py --save before.json     # save results ...
+    python benchmarks/run.py --compare before.json  # ... and compare with them
+
+When comparing, the exit status is 1 if any benchmark got slower than the
+baseline by more than ``--threshold`` (10 % by default), so it can be used to
+catch performance regressions e.g. before upgrading.
+
+Benchmarks with a hand-written equivalent (``reference``) also show how many
+times slower pipetools is than plain Python.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from suite import benchmarks  # noqa: E402
+
+
+def measure(function, repeat, min_time):
+    """
+    Returns the best time (in seconds) of a single call of `function`.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds >= 1 / scale:
+            return '%.3g %s' % (seconds * scale, unit)
+    return '%.3g ns' % (seconds * 1e9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run pipetools benchmarks.')
+    parser.add_argument('-k', dest='patterns', action='append', default=[],
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--large', action='store_true',
+                        help='also run the utils on 1e6 and 1e7 items')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='minimal time of one measurement in seconds')
+    parser.add_argument('--save', metavar='FILE', help='save results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare with saved results')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown considered a regression')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results, regressions = {}, []
+    print('%-45s %12s %12s %12s' % ('benchmark', 'time', 'vs plain', 'vs baseline'))
+    for name, make, make_reference in benchmarks(large=args.large):
+        if args.patterns and not any(p in name for p in args.patterns):
+            continue
+        result = results[name] = measure(make(), args.repeat, args.min_time)
+        reference = (
+            '%.2fx' % (result / measure(make_reference(), args.repeat, args.min_time))
+            if make_reference else '')
+        compared = ''
+        if name in baseline:
+            ratio = result / baseline[name]
+            compared = '%.2fx' % ratio
+            if ratio > 1 + args.threshold:
+                compared += ' !'
+                regressions.append(name)
+        print('%-45s %12s %12s %12s' % (name, format_time(result), reference, compared))
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print('\n%d benchmark(s) slower than the baseline by more than %d %%:' % (
+            len(regressions), args.threshold * 100))
+        for name in regressions:
+            print('  ' + name)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
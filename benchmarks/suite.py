@@ -0,0 +1,291 @@
+"""
+Benchmark definitions, see ``run.py``.
+
+Each benchmark is a function taking a parameter (e.g. number of items) and
+returning a function to be timed, and optionally a reference function
+making a hand-written equivalent for comparison.
+"""
+import atexit
+import os
+import re
+import shutil
+import tempfile
+from functools import partial, reduce
+from itertools import chain, groupby
+from operator import attrgetter, or_
+
+from pipetools import pipe, X, xpartial, foreach, where, sort_by, group_by, flatten
+from pipetools import take_first, where_not, read_lines, write_lines
+from pipetools import unless, select_first, first_of
+from pipetools.ds_builder import DSBuilder
+
+
+SIZES = 10 ** 3, 10 ** 5
+LARGE_SIZES = 10 ** 6, 10 ** 7
+
+_benchmarks = []
+
+
+def benchmark(name, params=(None,), sized=False, reference=None):
+    """
+    Registers a benchmark for each of `params` (or the number of items if
+    `sized`); `name` is formatted with it.
+    """
+    def register(make):
+        _benchmarks.append((name, params, sized, make, reference))
+        return make
+    return register
+
+
+def benchmarks(large=False):
+    """
+    Yields ``(name, make, make_reference)`` of all the benchmarks.
+    """
+    for name, params, sized, make, reference in _benchmarks:
+        for param in (SIZES + LARGE_SIZES if large else SIZES) if sized else params:
+            yield (
+                name.format('1e%d' % len(str(param)[1:]) if sized else param),
+                partial(make, param),
+                reference and partial(reference, param))
+
+
+def inc(x):
+    return x + 1
+
+
+def pipe_depth_reference(depth):
+    stages = [inc] * depth
+
+    def composite(x):
+        for stage in stages:
+            x = stage(x)
+        return x
+    return partial(composite, 0)
+
+
+@benchmark('pipe call, depth {0}', params=(1, 10, 100), reference=pipe_depth_reference)
+def pipe_depth(depth):
+    return partial(reduce(or_, [inc] * depth, pipe), 0)
+
+
+@benchmark('pipe construction')
+def pipe_construction(_):
+    return lambda: pipe | foreach(X.real) | where(X > 1) | sort_by(X) | take_first(10) | list
+
+
+class Item(object):
+
+    def __init__(self, value):
+        self.value = value
+        self.data = {'key': str(value)}
+
+
+_x_expressions = {
+    'X.value': (X.value, attrgetter('value')),
+    'X + 1': (X.value + 1, lambda x: x.value + 1),
+    "X.data['key'].upper()": (X.data['key'].upper(), lambda x: x.data['key'].upper()),
+    '(X.value * 2 + 1) % 3 > 0': (
+        (X.value * 2 + 1) % 3 > 0, lambda x: (x.value * 2 + 1) % 3 > 0),
+}
+
+
+def x_reference(expression):
+    return partial(_x_expressions[expression][1], Item(42))
+
+
+@benchmark('X: {0}', params=tuple(_x_expressions), reference=x_reference)
+def x_expression(expression):
+    return partial(~_x_expressions[expression][0], Item(42))
+
+
+def power(base, exp):
+    return base ** exp
+
+
+_xpartials = {
+    'no placeholder': (((power, 2), {}), partial(power, 2)),
+    'positional placeholder': (((power, 2, X), {}), lambda x: power(2, x)),
+    'placeholder expression': (((power, X + 1, 2), {}), lambda x: power(x + 1, 2)),
+    'keyword placeholder': (((power, 2), {'exp': X}), lambda x: power(2, exp=x)),
+}
+
+
+def xpartial_reference(kind):
+    return partial(_xpartials[kind][1], 3)
+
+
+@benchmark('xpartial: {0}', params=tuple(_xpartials), reference=xpartial_reference)
+def xpartial_call(kind):
+    args, kwargs = _xpartials[kind][0]
+    return partial(xpartial(*args, **kwargs), 3)
+
+
+def ds_builder_reference(_):
+    return partial(lambda x: {'value': x.value, 'key': x.data['key'], 'pair': (x.value, 1)}, Item(42))
+
+
+@benchmark('DSBuilder', reference=ds_builder_reference)
+def ds_builder(_):
+    build = DSBuilder({'value': X.value, 'key': X.data['key'], 'pair': (X.value, 1)})
+    return partial(build, Item(42))
+
+
+@benchmark('foreach, {0} items', sized=True, reference=lambda size: partial(
+    lambda items: [x * 2 for x in items], range(size)))
+def foreach_items(size):
+    return partial(pipe | foreach(X * 2) | list, range(size))
+
+
+@benchmark('where, {0} items', sized=True, reference=lambda size: partial(
+    lambda items: [x for x in items if x % 3], range(size)))
+def where_items(size):
+    return partial(pipe | where(X % 3) | list, range(size))
+
+
+@benchmark('where | foreach | where_not | foreach, {0} items', sized=True,
+           reference=lambda size: partial(
+               lambda items: [str(x * 2) for x in items if x % 3 and not x * 2 % 4 == 0],
+               range(size)))
+def lazy_chain_items(size):
+    f = pipe | where(X % 3) | foreach(X * 2) | where_not(X % 4 == 0) | foreach(str) | list
+    return partial(f, range(size))
+
+
+def _shuffled(size):
+    return [(i * 7919) % size for i in range(size)]
+
+
+@benchmark('sort_by, {0} items', sized=True, reference=lambda size: partial(
+    lambda items: sorted(items, key=lambda x: -x), _shuffled(size)))
+def sort_by_items(size):
+    return partial(sort_by(-X), _shuffled(size))
+
+
+@benchmark('sort_by | take_first(20), {0} items', sized=True, reference=lambda size: partial(
+    lambda items: sorted(items, key=lambda x: -x)[:20], _shuffled(size)))
+def sort_by_take_first_items(size):
+    return partial(pipe | sort_by(-X) | take_first(20) | list, _shuffled(size))
+
+
+def group_by_reference(size):
+
+    def group(items):
+        groups = {}
+        for x in items:
+            groups.setdefault(x % 10, []).append(x)
+        return list(groups.items())
+    return partial(group, range(size))
+
+
+@benchmark('group_by, {0} items', sized=True, reference=group_by_reference)
+def group_by_items(size):
+    return partial(group_by(X % 10), range(size))
+
+
+@benchmark('group_by.sorted, {0} items', sized=True, reference=lambda size: partial(
+    lambda items: [(k, list(g)) for k, g in groupby(items, lambda x: x // 10)], range(size)))
+def sorted_group_by_items(size):
+    return partial(group_by(X // 10).sorted | list, range(size))
+
+
+def _nested(size):
+    return [list(range(10)) for _ in range(size // 10)]
+
+
+@benchmark('flatten, {0} items', sized=True, reference=lambda size: partial(
+    lambda items: list(chain.from_iterable(items)), _nested(size)))
+def flatten_items(size):
+    return partial(flatten | list, _nested(size))
+
+
+def first_item(items):
+    return items[0]
+
+
+def unless_reference(items):
+
+    def first_or_none(items):
+        try:
+            return first_item(items)
+        except IndexError:
+            return None
+    return partial(first_or_none, items)
+
+
+@benchmark('unless, {0}', params=('ok', 'exception'),
+           reference=lambda kind: unless_reference([1] if kind == 'ok' else []))
+def unless_call(kind):
+    return partial(unless(IndexError, first_item), [1] if kind == 'ok' else [])
+
+
+def select_first_reference(size):
+
+    def select(items):
+        for x in items:
+            if x >= size // 2:
+                return x
+    return partial(select, range(size))
+
+
+@benchmark('select_first, {0} items', sized=True, reference=select_first_reference)
+def select_first_items(size):
+    return partial(select_first(X >= size // 2), range(size))
+
+
+def first_of_reference(size):
+
+    def first(items):
+        for x in items:
+            if x:
+                return x
+    return partial(first, [0] * size + [1])
+
+
+@benchmark('first_of, {0} items', sized=True, reference=first_of_reference)
+def first_of_items(size):
+    return partial(first_of, [0] * size + [1])
+
+
+_directory = tempfile.mkdtemp(prefix='pipetools-benchmarks-')
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+
+
+def _log_file(size):
+    path = os.path.join(_directory, 'log-%d.txt' % size)
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            for i in range(size):
+                f.write('%d %s some message\n' % (i, 'ERROR' if i % 1000 == 7 else 'ok'))
+    return path
+
+
+def grep_reference(size):
+    search = re.compile(r'\d+ ERROR').match
+    path = _log_file(size)
+
+    def grep():
+        with open(path) as f:
+            return [line.rstrip('\n') for line in f if search(line)]
+    return grep
+
+
+@benchmark('read_lines | where(regex), {0} lines', sized=True, reference=grep_reference)
+def read_lines_where(size):
+    return partial(read_lines | where(r'\d+ ERROR') | list, _log_file(size))
+
+
+def write_reference(size):
+    lines = ['line %d' % i for i in range(size)]
+    path = os.path.join(_directory, 'written.txt')
+
+    def write():
+        with open(path, 'w') as f:
+            for line in lines:
+                f.write(line + '\n')
+    return write
+
+
+@benchmark('write_lines, {0} lines', sized=True, reference=write_reference)
+def write_lines_items(size):
+    lines = ['line %d' % i for i in range(size)]
+    return partial(write_lines(os.path.join(_directory, 'written.txt')), lines)
@@ -3,8 +3,15 @@ from pipetools.utils import foreach
 __version__ = VERSION = 1, 1, 0
 __versionstr__ = VERSION > foreach(str) | '.'.join
 
-from pipetools.main import pipe, X, maybe, xpartial
+from pipetools.main import pipe, X, maybe, xpartial, intern_pipes
 from pipetools.utils import *
+from pipetools.profiling import profile
+
+try:
+    from pipetools.aio import AsyncPipe, apipe, foreach_async, where_async
+except SyntaxError:
+    # Python 2
+    pass
 
 # prevent namespace pollution
 import pipetools.compat
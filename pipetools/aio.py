@@ -0,0 +1,115 @@
+import asyncio
+from inspect import isawaitable
+
+from pipetools.debug import set_name, LazyName, util_name
+from pipetools.decorators import auto_string_formatter, data_structure_builder
+from pipetools.decorators import regex_condition
+from pipetools.main import Pipe, prepare_function_for_pipe
+
+
+class AsyncPipe(Pipe):
+    """
+    Pipe that can also contain coroutine functions (or any functions returning
+    awaitables). Their results are awaited before being passed on.
+
+    Calling the pipe returns a coroutine::
+
+        fetch_title = apipe | fetch_html | parse_html | X.title
+
+        title = await fetch_title(url)
+        title = await (url > fetch_title)
+    """
+
+    @classmethod
+    def composite(cls, stages):
+        first, rest = stages[0], stages[1:]
+
+        async def composite(*args, **kwargs):
+            result = first(*args, **kwargs)
+            if isawaitable(result):
+                result = await result
+            for stage in rest:
+                result = stage(result)
+                if isawaitable(result):
+                    result = await result
+            return result
+        return cls.set_stages(stages, composite)
+
+    def __call__(self, *args, **kwargs):
+        return _awaited(self.func(*args, **kwargs))
+
+    def __lt__(self, thing):
+        return self(thing) if self.func else _awaited(thing)
+
+
+apipe = AsyncPipe()
+
+
+async def _awaited(result):
+    return (await result) if isawaitable(result) else result
+
+
+@auto_string_formatter
+@data_structure_builder
+def foreach_async(function, *, concurrency=None):
+    """
+    Like :func:`~pipetools.utils.foreach`, but `function` can be
+    a coroutine function and the input can be an async iterable.
+
+    The function is applied to all the items concurrently, with at most
+    `concurrency` of them running at the same time (if given). The result
+    is a list.
+
+    >>> await (urls > apipe | foreach_async(fetch, concurrency=10))
+    """
+    function = prepare_function_for_pipe(function)
+
+    async def _foreach_async(iterable):
+        return await _gather(function, await _items(iterable), concurrency)
+
+    name = LazyName(util_name, 'foreach_async', function, (), _concurrency(concurrency))
+    return apipe | set_name(name, _foreach_async)
+
+
+@regex_condition
+def where_async(condition, *, concurrency=None):
+    """
+    Like :func:`~pipetools.utils.where`, but `condition` can be a coroutine
+    function and the input can be an async iterable.
+
+    The condition is evaluated for all the items concurrently, with at most
+    `concurrency` of them running at the same time (if given). The result
+    is a list.
+    """
+    condition = prepare_function_for_pipe(condition)
+
+    async def _where_async(iterable):
+        items = await _items(iterable)
+        results = await _gather(condition, items, concurrency)
+        return [item for item, result in zip(items, results) if result]
+
+    name = LazyName(util_name, 'where_async', condition, (), _concurrency(concurrency))
+    return apipe | set_name(name, _where_async)
+
+
+def _concurrency(concurrency):
+    return {'concurrency': concurrency} if concurrency else {}
+
+
+async def _items(iterable):
+    if hasattr(iterable, '__aiter__'):
+        return [item async for item in iterable]
+    return list(iterable)
+
+
+async def _gather(function, items, concurrency):
+    if not concurrency:
+        return await asyncio.gather(*[_awaited(function(item)) for item in items])
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def apply(item):
+        async with semaphore:
+            return await _awaited(function(item))
+
+    return await asyncio.gather(*[apply(item) for item in items])
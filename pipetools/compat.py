@@ -1,5 +1,37 @@
+import heapq
 import sys
 
+
+class _Inverted(object):
+    __slots__ = 'value',
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def decorated_merge(*iterables, **kwargs):
+    """
+    :func:`heapq.merge` with the `key` and `reverse` arguments it only has
+    since Python 3.5, merging ``(key, index of the iterable, item)`` tuples.
+    """
+    key = kwargs.pop('key', None) or (lambda item: item)
+    order = _Inverted if kwargs.pop('reverse', False) else (lambda value: value)
+    decorated = [_decorated(iterable, key, order, index)
+                 for index, iterable in enumerate(iterables)]
+    return (item for _, _, item in heapq.merge(*decorated))
+
+
+def _decorated(iterable, key, order, index):
+    for item in iterable:
+        yield order(key(item)), index, item
+
+
 if sys.version < '3':
     from itertools import imap as map
     from itertools import ifilter as filter
@@ -7,8 +39,17 @@ if sys.version < '3':
     text_type = unicode  # noqa
     string_types = basestring  # noqa
     dict_items = lambda d: d.iteritems()
+    from time import time as monotonic
+    from time import time as perf_counter
+    from Queue import Queue
+    from io import BytesIO as NativeStringIO
+    merge = decorated_merge
 else:
     from builtins import map, filter, range
     text_type = str
     string_types = str
     dict_items = lambda d: d.items()
+    from time import monotonic, perf_counter
+    from queue import Queue
+    from io import StringIO as NativeStringIO
+    from heapq import merge
@@ -1,6 +1,24 @@
 from itertools import chain
 
-from pipetools.compat import map, dict_items
+from pipetools.compat import map, filter, dict_items, string_types
+
+
+class LazyName(object):
+    """
+    Name of a pipetools function, described by the `parts` the function was
+    made of and a `formatter` to make the name from them.
+
+    The name is only made when needed (see :func:`get_name`), so creating
+    a function doesn't need to allocate a closure just for its name.
+    """
+    __slots__ = 'formatter', 'parts'
+
+    def __init__(self, formatter, *parts):
+        self.formatter = formatter
+        self.parts = parts
+
+    def __call__(self):
+        return self.formatter(*self.parts)
 
 
 def set_name(name, f):
@@ -27,3 +45,13 @@ def repr_args(*args, **kwargs):
     return ', '.join(chain(
         map('{0!r}'.format, args),
         map('{0[0]}={0[1]!r}'.format, dict_items(kwargs))))
+
+
+def util_name(util, function, args, kwargs):
+    """
+    Name for `util` applied to `function` and other arguments, e.g.
+    ``foreach(my_func, 42, kwarg=2)``.
+    """
+    return '%s(%s)' % (
+        util if isinstance(util, string_types) else get_name(util),
+        ', '.join(filter(None, (get_name(function), repr_args(*args, **kwargs)))))
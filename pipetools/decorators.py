@@ -1,9 +1,10 @@
 import re
-from functools import partial, wraps
+from functools import wraps
 
-from pipetools.debug import repr_args, set_name, get_name
-from pipetools.ds_builder import DSBuilder, NoBuilder
-from pipetools.main import pipe, XObject, StringFormatter, xpartial, maybe
+from pipetools.debug import set_name, LazyName, util_name
+from pipetools.ds_builder import DSBuilder, select_builder
+from pipetools.main import Pipe, XObject, StringFormatter, xpartial
+from pipetools.main import xfunction, interned
 from pipetools.compat import string_types, dict_items
 
 
@@ -12,21 +13,21 @@ def pipe_util(func):
     Decorator that handles X objects and partial application for pipe-utils.
     """
     @wraps(func)
+    @interned
     def pipe_util_wrapper(function, *args, **kwargs):
         if isinstance(function, XObject):
-            function = ~function
+            function = xfunction(function)
 
         original_function = function
 
         if args or kwargs:
             function = xpartial(function, *args, **kwargs)
 
-        name = lambda: '%s(%s)' % (get_name(func), ', '.join(
-            filter(None, (get_name(original_function), repr_args(*args, **kwargs)))))
+        name = LazyName(util_name, func, original_function, args, kwargs)
 
         f = func(function)
 
-        result = pipe | set_name(name, f)
+        result = Pipe(set_name(name, f))
 
         # if the util defines an 'attrs' mapping, copy it as attributes
         # to the result
@@ -62,10 +63,8 @@ def data_structure_builder(func):
     """
     @wraps(func)
     def ds_builder_wrapper(function, *args, **kwargs):
-        try:
+        if select_builder(function):
             function = DSBuilder(function)
-        except NoBuilder:
-            pass
         return func(function, *args, **kwargs)
 
     return ds_builder_wrapper
@@ -78,7 +77,36 @@ def regex_condition(func):
     """
     @wraps(func)
     def regex_condition_wrapper(condition, *args, **kwargs):
-        if isinstance(condition, string_types):
-            condition = maybe | partial(re.match, condition)
+        if isinstance(condition, _regex_types):
+            condition = regex_matcher(condition)
         return func(condition, *args, **kwargs)
     return regex_condition_wrapper
+
+
+_pattern_type = type(re.compile(''))
+_regex_types = string_types, bytes, _pattern_type
+
+
+def regex_matcher(pattern, method='match', flags=0):
+    """
+    Returns a function that matches strings (or bytes) against a regular
+    expression using its `method` - ``'match'``, ``'search'`` or
+    ``'fullmatch'``. ``None`` doesn't match anything.
+
+    The `pattern` is compiled just once. It is what
+    :func:`regex_condition` uses for string conditions, but it can also be
+    used directly to choose a different `method` or `flags`::
+
+        where(regex_matcher('error', 'search', re.IGNORECASE))
+    """
+    if not isinstance(pattern, _pattern_type):
+        pattern = re.compile(pattern, flags)
+    test = getattr(pattern, method)
+
+    def regex_match(string):
+        return None if string is None else test(string)
+
+    regex_match.regex = pattern
+    regex_match.method = method
+    name = LazyName('regex_matcher({0!r}, {1!r})'.format, pattern.pattern, method)
+    return set_name(name, regex_match)
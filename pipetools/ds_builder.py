@@ -1,13 +1,15 @@
 from functools import partial
 
-from pipetools.main import XObject, StringFormatter
-from pipetools.compat import string_types, dict_items
+from pipetools.main import XObject, StringFormatter, xfunction, interned
+from pipetools.main import generated_function, x_source, constant_name
+from pipetools.compat import string_types, text_type, dict_items
 
 
 class NoBuilder(ValueError):
     pass
 
 
+@interned
 def DSBuilder(definition):
     builder = select_builder(definition)
     if builder:
@@ -16,13 +18,20 @@ def DSBuilder(definition):
 
 
 def SequenceBuilder(cls, definition):
-    return lambda x: cls(ds_item(d, x) for d in definition)
+    constants = []
+    items = [item_source(d, constants) for d in definition]
+    if cls is tuple:
+        source = '(%s)' % ''.join(item + ', ' for item in items)
+    elif cls is list:
+        source = '[%s]' % ', '.join(items)
+    else:
+        source = '%s([%s])' % (constant_name(cls, constants), ', '.join(items))
+    return generated_function('return ' + source, constants)
 
 
 def DictBuilder(definition):
-    return lambda x: dict(
-        (ds_item(key_def, x), ds_item(val_def, x))
-        for key_def, val_def in dict_items(definition))
+    constants = []
+    return generated_function('return ' + item_source(definition, constants), constants)
 
 
 builders = {
@@ -38,9 +47,49 @@ def select_builder(definition):
             return builder
 
 
+# X expressions longer than this are called as a compiled function instead
+# of being inlined, to keep the generated expressions reasonably shallow
+_MAX_INLINE_X = 16
+
+
+def item_source(definition, constants):
+    """
+    Returns source code of an expression building `definition` from ``x``,
+    so that a whole data structure is built by a single generated function
+    (with no checks of what its items are when it's called).
+
+    X expressions are inlined, tuples, lists and dicts become displays
+    and static items are constants (appended to `constants`).
+    """
+    if isinstance(definition, XObject):
+        if len(definition._operations) <= _MAX_INLINE_X:
+            return x_source(definition._operations, 'x', constants)
+        return constant_name(xfunction(definition), constants) + '(x)'
+    if isinstance(definition, string_types):
+        if '{' not in definition and '}' not in definition:
+            # formatting wouldn't change it
+            return constant_name(text_type(definition), constants)
+        return constant_name(StringFormatter(definition), constants) + '(x)'
+    if callable(definition):
+        return constant_name(definition, constants) + '(x)'
+    if isinstance(definition, tuple):
+        return '(%s)' % ''.join(item_source(d, constants) + ', ' for d in definition)
+    if isinstance(definition, list):
+        return '[%s]' % ', '.join(item_source(d, constants) for d in definition)
+    if isinstance(definition, dict):
+        return '{%s}' % ', '.join(
+            '%s: %s' % (item_source(key_def, constants), item_source(val_def, constants))
+            for key_def, val_def in dict_items(definition))
+    builder = select_builder(definition)
+    if builder:
+        return constant_name(builder(definition), constants) + '(x)'
+    # static item
+    return constant_name(definition, constants)
+
+
 def ds_item(definition, data):
     if isinstance(definition, XObject):
-        return (~definition)(data)
+        return xfunction(definition)(data)
     if isinstance(definition, string_types):
         return StringFormatter(definition)(data)
     if callable(definition):
@@ -1,12 +1,155 @@
+from __future__ import division
+import re
+from keyword import iskeyword
+
 try:
     from collections.abc import Iterable
 except ImportError:
     from collections import Iterable
 
+from collections import OrderedDict
 from functools import partial, wraps, WRAPPER_ASSIGNMENTS
+from threading import Lock
+from types import FunctionType
+
+from pipetools.debug import get_name, set_name, repr_args, LazyName
+from pipetools.compat import text_type, string_types, dict_items, map
+
+
+_interned = None
+_interned_lock = Lock()
+
+# set by pipetools.profiling.profile
+_profiler = None
+_INTERNED_DEFAULT_SIZE = 1024
+
+
+def intern_pipes(maxsize=_INTERNED_DEFAULT_SIZE):
+    """
+    Enables interning of pipes and the parts they're made of: pipe-utils,
+    :doc:`X object<xobject>` functions, :func:`xpartial`, automatically
+    created data structures and string formatters.
+
+    Constructing them from structurally identical definitions (the same
+    functions, ``X`` expressions, strings, numbers and tuples of those,
+    the same list and dict objects) then returns the same object from
+    a cache of the last `maxsize` definitions, instead of wrapping
+    everything again. Useful when
+    pipes are built dynamically, e.g. for every request::
+
+        >>> intern_pipes()
+        >>> (pipe | where(X.size > 10) | foreach(X.name)) is (pipe | where(X.size > 10) | foreach(X.name))
+        True
+
+    ``intern_pipes(0)`` disables interning (which is the default).
+
+    Interned objects are shared, so they shouldn't be modified.
+    """
+    global _interned
+    with _interned_lock:
+        _interned = (OrderedDict(), maxsize) if maxsize else None
 
-from pipetools.debug import get_name, set_name, repr_args
-from pipetools.compat import text_type, string_types, dict_items
+
+def interned(func):
+    """
+    Decorator for functions making pipetools objects, so they are interned
+    when enabled by :func:`intern_pipes`.
+    """
+    code = func.__code__
+    positional = not (code.co_flags & (_CO_VARARGS | _CO_VARKEYWORDS) or func.__defaults__)
+    # the common cases without packing the arguments, which would be most
+    # of the overhead when interning is disabled
+    if positional and code.co_argcount == 1:
+        def interned_wrapper(a):
+            if _interned is None:
+                return func(a)
+            return _interned_call(func, (a,), None)
+    elif positional and code.co_argcount == 2:
+        def interned_wrapper(a, b):
+            if _interned is None:
+                return func(a, b)
+            return _interned_call(func, (a, b), None)
+    else:
+        def interned_wrapper(*args, **kwargs):
+            if _interned is None:
+                return func(*args, **kwargs)
+            return _interned_call(func, args, kwargs)
+    return wraps(func)(interned_wrapper)
+
+
+_CO_VARARGS, _CO_VARKEYWORDS = 0x04, 0x08
+
+
+def _interned_call(func, args, kwargs):
+    state = _interned
+    if state is None:
+        return func(*args, **kwargs or {})
+
+    cache, maxsize = state
+    # kwargs is a new dict on every call, so it's keyed by its items
+    kwargs_key = _intern_key(tuple(sorted(kwargs.items()))) if kwargs else None
+    key = func, _intern_key(args), kwargs_key
+    with _interned_lock:
+        result = cache.get(key)
+        if result is not None:
+            cache[key] = cache.pop(key)
+            return result
+
+    result = func(*args, **kwargs or {})
+    with _interned_lock:
+        cache[key] = result
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+    return result
+
+
+_by_value = frozenset([bool, int, bytes, text_type, str, type(None)])
+
+# 0.0 == -0.0, but they're not the same in e.g. X * -0.0
+_by_repr = frozenset([float, complex])
+
+
+def _intern_key(value):
+    cls = type(value)
+    if cls in _by_value:
+        # the type is part of the key, otherwise e.g. X + 1 and X + 1.0
+        # would be interned as the same thing
+        return cls, value
+    if cls in _by_repr:
+        return cls, repr(value)
+    if cls is tuple:
+        return cls, tuple([
+            (type(v), v) if type(v) in _by_value else _intern_key(v)
+            for v in value])
+    if cls is XObject:
+        if value._intern_key is None:
+            # the source and operands determine the rest of the operation
+            value._intern_key = XObject, tuple([
+                (source, _intern_key(operands))
+                for source, _, operands, _ in value._operations])
+        return value._intern_key
+    if cls.__eq__ is object.__eq__ and cls.__hash__ is object.__hash__:
+        # already only the same as itself, e.g. functions
+        return value
+    # including lists and dicts, as the interned object would keep the one
+    # it was made with, which can be changed later
+    return _Reference(value)
+
+
+class _Reference(object):
+    """
+    Interning key for objects that are only the same as themselves.
+    """
+    __slots__ = 'value',
+
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return id(self.value)
+
+    def __eq__(self, other):
+        return type(other) is _Reference and other.value is self.value
 
 
 class Pipe(object):
@@ -20,8 +163,15 @@ class Pipe(object):
         p(x) == H(G(F(x)))
 
     """
-    def __init__(self, func=None):
-        self.func = func
+    # makes numpy arrays leave the comparison to us in ``array > pipe``
+    __array_ufunc__ = None
+
+    def __init__(self, func=None, composed=None):
+        if composed is None:
+            self.func = func
+        else:
+            # the class composing it and its stages, see _Composed
+            self._composed = composed
         self.__name__ = 'Pipe'
 
     def __str__(self):
@@ -29,36 +179,116 @@ class Pipe(object):
 
     __repr__ = __str__
 
-    @staticmethod
-    def compose(first, second):
-        name = lambda: '{0} | {1}'.format(get_name(first), get_name(second))
+    @classmethod
+    def compose(cls, first, second):
+        return cls.composite(cls.fused(cls.joined_stages(first, second)))
+
+    @classmethod
+    def composite(cls, stages):
+        """
+        Returns a function executing `stages` one after another.
+        """
+        plain = stages[0], stages[1:]
 
         def composite(*args, **kwargs):
-            return second(first(*args, **kwargs))
-        return set_name(name, composite)
+            first, rest = plain if _profiler is None else _profiler.instrument(stages)
+            result = first(*args, **kwargs)
+            for stage in rest:
+                result = stage(result)
+            return result
+        return cls.set_stages(stages, composite)
 
     @classmethod
-    def bind(cls, first, second, new_cls=None):
-        return (new_cls or cls)(
-            first if second is None else
-            second if first is None else
-            cls.compose(first, second))
+    def stages(cls, f):
+        """
+        Returns a tuple of functions that `f` executes one after another, if
+        it has been composed by this kind of pipe. Otherwise it's a single
+        stage.
+
+        This keeps the composite functions flat, so a long pipe is executed in
+        a single loop instead of a call stack as deep as the pipe is long.
+        """
+        if isinstance(f, Pipe):
+            composed = f.__dict__.get('_composed')
+            if composed is not None and composed[0] is cls and 'func' not in f.__dict__:
+                # not used yet, so its stages aren't fused yet either
+                return composed[1]
+            if type(f) is Pipe and f.func is not None:
+                # a plain pipe object in a pipe would only add a function call
+                f = f.func
+        if type(f) is not FunctionType:
+            # e.g. a class, whose missing attribute is slow to look up
+            return (f,)
+        name = getattr(f, '__pipetools__name__', None)
+        if (type(name) is LazyName and name.formatter is _stages_name
+                and name.parts[0] is cls):
+            return name.parts[1]
+        return (f,)
 
+    @classmethod
+    def joined_stages(cls, first, second):
+        """
+        Returns stages of `first` followed by stages of `second`.
+        """
+        return cls.stages(first) + cls.stages(second)
+
+    @classmethod
+    def fused(cls, stages):
+        """
+        Returns `stages` with the adjacent ones fused where possible.
+
+        A stage can have a ``__pipetools__fuse__`` function, which gets the
+        stage that follows it and can return a single function doing the
+        work of both (more efficiently), or ``None``.
+        """
+        result = [stages[0]]
+        for stage in stages[1:]:
+            fuse = getattr(result[-1], '__pipetools__fuse__', None)
+            fused = fuse and fuse(stage)
+            if fused is None:
+                result.append(stage)
+            else:
+                result[-1] = set_name(LazyName(_fused_name, cls, (result[-1], stage)), fused)
+        return tuple(result)
+
+    separator = ' | '
+
+    @classmethod
+    def set_stages(cls, stages, composite):
+        return set_name(LazyName(_stages_name, cls, stages), composite)
+
+    @classmethod
+    def bind(cls, first, second, new_cls=None):
+        # `first` and `second` can also be composed pipes, so their function
+        # isn't made just to be composed again
+        new_cls = new_cls or cls
+        if second is None:
+            return new_cls(_function_of(first))
+        if first is None:
+            return new_cls(_function_of(second))
+        return new_cls(composed=(cls, cls.joined_stages(first, second)))
+
+    @interned
     def __or__(self, next_func):
         # Handle multiple pipes in pipe definition and also changing pipe type to e.g. Maybe
         # this is needed because of evaluation order
-        pipe_in_a_pipe = isinstance(next_func, Pipe) and next_func.func is None
-        new_cls = type(next_func) if pipe_in_a_pipe else None
-        next = None if pipe_in_a_pipe else prepare_function_for_pipe(next_func)
-        return self.bind(self.func, next, new_cls)
+        first = self.__dict__.get('func', self)
+        if isinstance(next_func, Pipe) and _function_of(next_func) is None:
+            return self.bind(first, None, type(next_func))
+        return self.bind(first, prepare_function_for_pipe(next_func))
 
+    @interned
     def __ror__(self, prev_func):
-        return self.bind(prepare_function_for_pipe(prev_func), self.func)
+        return self.bind(prepare_function_for_pipe(prev_func), self.__dict__.get('func', self))
 
     def __lt__(self, thing):
-        return self.func(thing) if self.func else thing
+        if not self.func:
+            return thing
+        return (self.func if _profiler is None else _profiled(self.func))(thing)
 
     def __call__(self, *args, **kwargs):
+        if _profiler is not None:
+            return _profiled(self.func)(*args, **kwargs)
         return self.func(*args, **kwargs)
 
     def __get__(self, instance, owner):
@@ -68,27 +298,86 @@ class Pipe(object):
 pipe = Pipe()
 
 
+class _Composed(object):
+    """
+    :attr:`Pipe.func` of a pipe composed of stages, made (and its stages
+    fused) when first used, so a pipe built with many ``|`` doesn't make a
+    function for each of them.
+    """
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        cls, stages = instance._composed
+        func = instance.func = cls.composite(cls.fused(stages))
+        return func
+
+
+Pipe.func = _Composed()
+
+
+def _function_of(pipe):
+    # the pipe itself if it's composed and its function isn't made yet
+    return pipe.__dict__.get('func', pipe) if isinstance(pipe, Pipe) else pipe
+
+
+def _profiled(func):
+    # composites measure their stages themselves, see Pipe.composite
+    name = getattr(func, '__pipetools__name__', None)
+    if type(name) is LazyName and name.formatter is _stages_name:
+        return func
+    return _profiler.function(func)
+
+
+def _stages_name(pipe_class, stages):
+    return pipe_class.separator.join(map(get_name, stages))
+
+
+def _fused_name(pipe_class, stages):
+    # same as _stages_name, but not recognized as a composite by Pipe.stages
+    return pipe_class.separator.join(map(get_name, stages))
+
+
+def unfused(stages):
+    """
+    Returns `stages` with the fused ones (see :meth:`Pipe.fused`)
+    replaced by the original stages.
+    """
+    result = []
+    for stage in stages:
+        name = getattr(stage, '__pipetools__name__', None)
+        if type(name) is LazyName and name.formatter is _fused_name:
+            result.extend(unfused(name.parts[1]))
+        else:
+            result.append(stage)
+    return tuple(result)
+
+
 class Maybe(Pipe):
 
-    @staticmethod
-    def compose(first, second):
-        name = lambda: '{0} ?| {1}'.format(get_name(first), get_name(second))
+    @classmethod
+    def composite(cls, stages):
+        plain = stages[0], stages[1:]
 
         def composite(*args, **kwargs):
+            first, rest = plain if _profiler is None else _profiler.instrument(stages)
             result = first(*args, **kwargs)
-            return None if result is None else second(result)
-        return set_name(name, composite)
+            for stage in rest:
+                if result is None:
+                    return None
+                result = stage(result)
+            return result
+        return cls.set_stages(stages, composite)
+
+    separator = ' ?| '
 
     def __call__(self, *args, **kwargs):
         if len(args) == 1 and args[0] is None and not kwargs:
             return None
-        return self.func(*args, **kwargs)
+        return Pipe.__call__(self, *args, **kwargs)
 
     def __lt__(self, thing):
-        return (
-            None if thing is None else
-            self.func(thing) if self.func else
-            thing)
+        return None if thing is None else Pipe.__lt__(self, thing)
 
 
 maybe = Maybe()
@@ -96,7 +385,7 @@ maybe = Maybe()
 
 def prepare_function_for_pipe(thing):
     if isinstance(thing, XObject):
-        return ~thing
+        return xfunction(thing)
     if isinstance(thing, tuple):
         return xpartial(*thing)
     if isinstance(thing, string_types):
@@ -106,6 +395,7 @@ def prepare_function_for_pipe(thing):
     raise ValueError('Cannot pipe %s' % thing)
 
 
+@interned
 def StringFormatter(template):
 
     f = text_type(template).format
@@ -117,7 +407,7 @@ def StringFormatter(template):
             return f(*content)
         return f(content)
 
-    return set_name(lambda: "format('%s')" % template[:20], format)
+    return set_name(LazyName("format('{0:.20}')".format, template), format)
 
 
 def _iterable(obj):
@@ -126,138 +416,170 @@ def _iterable(obj):
 
 
 class XObject(object):
+    """
+    Records the operations done to it, so they can later be turned into
+    a function by ``~``.
+
+    Each operation is a ``(source, name, operands, elementwise)`` tuple,
+    where `source` is a template of a Python expression applying the
+    operation on ``{x}`` (with the operands as ``{0}``, ``{1}``, ...),
+    `name` is either a template for the operation's name or a function of the
+    operands returning one and `elementwise` tells whether the operation is
+    an operator which arrays apply element by element.
+
+    The expression is compiled into a single function the first time it's
+    inverted. If all its operations are element-wise, the function has an
+    ``elementwise`` attribute set to ``True``.
+    """
 
-    def __init__(self, func=None):
-        self._func = func
-        set_name(lambda: get_name(func) if func else 'X', self)
+    __slots__ = '_operations', '_compiled', '_intern_key'
+
+    def __init__(self, operations=()):
+        self._operations = operations
+        self._compiled = None
+        self._intern_key = None
+
+    def __pipetools__name__(self):
+        return ' | '.join(
+            name(*operands) if callable(name) else name.format(*operands)
+            for _, name, operands, _ in self._operations) or 'X'
 
     def __repr__(self):
         return get_name(self)
 
     def __invert__(self):
-        return self._func or set_name('X', lambda x: x)
+        if self._compiled is None:
+            self._compiled = _invert(self)
+        return self._compiled
+
+    def _bind(self, source, name, *operands):
+        return XObject(self._operations + ((source, name, operands, False),))
+
+    def _operator(self, source, name, *operands):
+        # an operation that numpy arrays (and similar) do element-wise
+        return XObject(self._operations + ((source, name, operands, True),))
 
     def bind(self, name, func):
         set_name(name, func)
-        return XObject((self._func | func) if self._func else (pipe | func))
+        return self._bind('{0}({x})', get_name, func)
 
     def __call__(self, *args, **kwargs):
-        name = lambda: 'X(%s)' % repr_args(*args, **kwargs)
-        return self.bind(name, lambda x: x(*args, **kwargs))
+        if not args and not kwargs:
+            return self._bind('{x}()', 'X()')
+        return self._bind('{x}(*{0}, **{1})', _call_name, args, kwargs)
 
     def __hash__(self):
         return super(XObject, self).__hash__()
 
     def __eq__(self, other):
-        return self.bind(lambda: 'X == {0!r}'.format(other), lambda x: x == other)
+        return self._operator('({x} == {0})', 'X == {0!r}', other)
 
     def __getattr__(self, name):
-        return self.bind(lambda: 'X.{0}'.format(name), lambda x: getattr(x, name))
+        if _is_identifier(name):
+            return self._bind('{x}.%s' % name, 'X.{0}', name)
+        return self._bind('getattr({x}, {0})', 'X.{0}', name)
 
     def __getitem__(self, item):
-        return self.bind(lambda: 'X[{0!r}]'.format(item), lambda x: x[item])
+        return self._bind('{x}[{0}]', 'X[{0!r}]', item)
 
     def __gt__(self, other):
-        return self.bind(lambda: 'X > {0!r}'.format(other), lambda x: x > other)
+        return self._operator('({x} > {0})', 'X > {0!r}', other)
 
     def __ge__(self, other):
-        return self.bind(lambda: 'X >= {0!r}'.format(other), lambda x: x >= other)
+        return self._operator('({x} >= {0})', 'X >= {0!r}', other)
 
     def __lt__(self, other):
-        return self.bind(lambda: 'X < {0!r}'.format(other), lambda x: x < other)
+        return self._operator('({x} < {0})', 'X < {0!r}', other)
 
     def __le__(self, other):
-        return self.bind(lambda: 'X <= {0!r}'.format(other), lambda x: x <= other)
+        return self._operator('({x} <= {0})', 'X <= {0!r}', other)
 
     def __ne__(self, other):
-        return self.bind(lambda: 'X != {0!r}'.format(other), lambda x: x != other)
+        return self._operator('({x} != {0})', 'X != {0!r}', other)
 
     def __pos__(self):
-        return self.bind(lambda: '+X', lambda x: +x)
+        return self._operator('(+{x})', '+X')
 
     def __neg__(self):
-        return self.bind(lambda: '-X', lambda x: -x)
+        return self._operator('(-{x})', '-X')
 
     def __mul__(self, other):
-        return self.bind(lambda: 'X * {0!r}'.format(other), lambda x: x * other)
+        return self._operator('({x} * {0})', 'X * {0!r}', other)
 
     def __rmul__(self, other):
-        return self.bind(lambda: '{0!r} * X'.format(other), lambda x: other * x)
+        return self._operator('({0} * {x})', '{0!r} * X', other)
 
     def __matmul__(self, other):
-        # prevent syntax error on legacy interpretors
-        from operator import matmul
-        return self.bind(lambda: 'X @ {0!r}'.format(other), lambda x: matmul(x, other))
+        return self._bind('({x} @ {0})', 'X @ {0!r}', other)
 
     def __rmatmul__(self, other):
-        from operator import matmul
-        return self.bind(lambda: '{0!r} @ X'.format(other), lambda x: matmul(other, x))
+        return self._bind('({0} @ {x})', '{0!r} @ X', other)
 
     def __div__(self, other):
-        return self.bind(lambda: 'X / {0!r}'.format(other), lambda x: x / other)
+        return self._operator('({x} / {0})', 'X / {0!r}', other)
 
     def __rdiv__(self, other):
-        return self.bind(lambda: '{0!r} / X'.format(other), lambda x: other / x)
+        return self._operator('({0} / {x})', '{0!r} / X', other)
 
     def __truediv__(self, other):
-        return self.bind(lambda: 'X / {0!r}'.format(other), lambda x: x / other)
+        return self._operator('({x} / {0})', 'X / {0!r}', other)
 
     def __rtruediv__(self, other):
-        return self.bind(lambda: '{0!r} / X'.format(other), lambda x: other / x)
+        return self._operator('({0} / {x})', '{0!r} / X', other)
 
     def __floordiv__(self, other):
-        return self.bind(lambda: 'X // {0!r}'.format(other), lambda x: x // other)
+        return self._operator('({x} // {0})', 'X // {0!r}', other)
 
     def __rfloordiv__(self, other):
-        return self.bind(lambda: '{0!r} // X'.format(other), lambda x: other // x)
+        return self._operator('({0} // {x})', '{0!r} // X', other)
 
     def __mod__(self, other):
-        return self.bind(lambda: 'X % {0!r}'.format(other), lambda x: x % other)
+        return self._operator('({x} % {0})', 'X % {0!r}', other)
 
     def __rmod__(self, other):
-        return self.bind(lambda: '{0!r} % X'.format(other), lambda x: other % x)
+        return self._operator('({0} % {x})', '{0!r} % X', other)
 
     def __add__(self, other):
-        return self.bind(lambda: 'X + {0!r}'.format(other), lambda x: x + other)
+        return self._operator('({x} + {0})', 'X + {0!r}', other)
 
     def __radd__(self, other):
-        return self.bind(lambda: '{0!r} + X'.format(other), lambda x: other + x)
+        return self._operator('({0} + {x})', '{0!r} + X', other)
 
     def __sub__(self, other):
-        return self.bind(lambda: 'X - {0!r}'.format(other), lambda x: x - other)
+        return self._operator('({x} - {0})', 'X - {0!r}', other)
 
     def __rsub__(self, other):
-        return self.bind(lambda: '{0!r} - X'.format(other), lambda x: other - x)
+        return self._operator('({0} - {x})', '{0!r} - X', other)
 
     def __pow__(self, other):
-        return self.bind(lambda: 'X ** {0!r}'.format(other), lambda x: x ** other)
+        return self._operator('({x} ** {0})', 'X ** {0!r}', other)
 
     def __rpow__(self, other):
-        return self.bind(lambda: '{0!r} ** X'.format(other), lambda x: other ** x)
+        return self._operator('({0} ** {x})', '{0!r} ** X', other)
 
     def __lshift__(self, other):
-        return self.bind(lambda: 'X << {0!r}'.format(other), lambda x: x << other)
+        return self._operator('({x} << {0})', 'X << {0!r}', other)
 
     def __rlshift__(self, other):
-        return self.bind(lambda: '{0!r} << X'.format(other), lambda x: other << x)
+        return self._operator('({0} << {x})', '{0!r} << X', other)
 
     def __rshift__(self, other):
-        return self.bind(lambda: 'X >> {0!r}'.format(other), lambda x: x >> other)
+        return self._operator('({x} >> {0})', 'X >> {0!r}', other)
 
     def __rrshift__(self, other):
-        return self.bind(lambda: '{0!r} >> X'.format(other), lambda x: other >> x)
+        return self._operator('({0} >> {x})', '{0!r} >> X', other)
 
     def __and__(self, other):
-        return self.bind(lambda: 'X & {0!r}'.format(other), lambda x: x & other)
+        return self._operator('({x} & {0})', 'X & {0!r}', other)
 
     def __rand__(self, other):
-        return self.bind(lambda: '{0!r} & X'.format(other), lambda x: other & x)
+        return self._operator('({0} & {x})', '{0!r} & X', other)
 
     def __xor__(self, other):
-        return self.bind(lambda: 'X ^ {0!r}'.format(other), lambda x: x ^ other)
+        return self._operator('({x} ^ {0})', 'X ^ {0!r}', other)
 
     def __rxor__(self, other):
-        return self.bind(lambda: '{0!r} ^ X'.format(other), lambda x: other ^ x)
+        return self._operator('({0} ^ {x})', '{0!r} ^ X', other)
 
     def __ror__(self, func):
         return pipe | func | self
@@ -268,12 +590,132 @@ class XObject(object):
         return pipe | self | func
 
     def _in_(self, y):
-        return self.bind(lambda: 'X._in_({0!r})'.format(y), lambda x: x in y)
+        return self._bind('({x} in {0})', 'X._in_({0!r})', y)
 
 
 X = XObject()
 
 
+def xfunction(x):
+    """
+    Returns the plain function compiled from :class:`XObject` `x`.
+
+    Unlike ``~x`` it isn't wrapped in a :class:`Pipe`, so it's a little
+    faster to call. Used where the result is not exposed to the user.
+    """
+    inverted = ~x
+    return inverted.func if isinstance(inverted, Pipe) else inverted
+
+
+@interned
+def _invert(x):
+    if not x._operations:
+        return set_name('X', lambda x: x)
+    return Pipe(set_name(x.__pipetools__name__, compile_x(x._operations)))
+
+
+def _call_name(args, kwargs):
+    return 'X(%s)' % repr_args(*args, **kwargs)
+
+
+def _is_identifier(name):
+    return _identifier_re.match(name) and not iskeyword(name)
+
+
+_identifier_re = re.compile(r'^[^\W\d]\w*\Z', re.UNICODE)
+
+
+_code_cache = {}
+# code factories of compile_x by the operations' source templates
+_x_code_cache = {}
+_CODE_CACHE_SIZE = 1024
+
+
+def compile_x(operations):
+    """
+    Compiles a sequence of :class:`XObject` operations into one function.
+
+    The generated code only depends on the operations' source templates, so
+    it's cached and shared by all expressions of the same shape, e.g.
+    ``X.foo['bar'] + 1`` and ``X.foo['baz'] + 2``.
+    """
+    shape, operands, elementwise = [], [], True
+    for source, _, args, is_elementwise in operations:
+        shape.append(source)
+        operands.extend(args)
+        elementwise = elementwise and is_elementwise
+    shape = tuple(shape)
+    make_function = _x_code_cache.get(shape)
+    if make_function is None:
+        constants = []
+        body = ''.join('x = %s\n' % x_source([operation], 'x', constants)
+                       for operation in operations)
+        make_function = code_factory(body + 'return x', len(constants))
+        if len(_x_code_cache) >= _CODE_CACHE_SIZE:
+            _x_code_cache.clear()
+        _x_code_cache[shape] = make_function
+    function = make_function(*operands)
+    if elementwise:
+        function.elementwise = True
+    # so it can be inlined into other generated code
+    function.x_operations = operations
+    return function
+
+
+def x_source(operations, expression, constants):
+    """
+    Returns source code of an expression applying `operations` (of an
+    :class:`XObject`) to `expression`. Their operands are appended to
+    `constants` and referred to as ``_0``, ``_1``, ...
+    """
+    for source, _, operands, _ in operations:
+        names = [constant_name(operand, constants) for operand in operands]
+        expression = source.format(*names, x=expression)
+    return expression
+
+
+def constant_name(value, constants):
+    constants.append(value)
+    return '_%d' % (len(constants) - 1)
+
+
+def generated_function(body, constants, params='x'):
+    """
+    Returns a function with the given `params` (``x`` by default) and `body`
+    (source code), which can refer to `constants` as ``_0``, ``_1``, ...
+
+    The compiled code is cached, so functions differing only in their
+    constants share it.
+    """
+    return code_factory(body, len(constants), params)(*constants)
+
+
+def code_factory(body, n_constants, params='x'):
+    """
+    Returns a (cached) function making the functions of
+    :func:`generated_function` from the constants.
+    """
+    key = params, body
+    make_function = _code_cache.get(key)
+    if make_function is None:
+        if len(_code_cache) >= _CODE_CACHE_SIZE:
+            _code_cache.clear()
+        make_function = _code_cache[key] = _generate_code(params, body, n_constants)
+    return make_function
+
+
+def _generate_code(params, body, n_constants):
+    code = '\n'.join(
+        ['def make_function(%s):' % ', '.join('_%d' % i for i in range(n_constants)),
+         '    def generated(%s):' % params] +
+        ['        ' + line for line in body.split('\n')] +
+        ['    return generated'])
+    namespace = {}
+    exec(compile(code, '<pipetools>', 'exec', division.compiler_flag, True), namespace)
+    return namespace['make_function']
+
+
+@interned
 def xpartial(func, *xargs, **xkwargs):
     """
     Like :func:`functools.partial`, but can take an :class:`XObject`
@@ -301,25 +743,48 @@ def xpartial(func, *xargs, **xkwargs):
     which will bind to classes (like the ``curry`` function from
     ``django.utils.functional``).
     """
+    # the call is generated with the placeholders' expressions inlined,
+    # so nothing is checked or rebuilt when it's called
     any_x = any(isinstance(a, XObject) for a in xargs + tuple(xkwargs.values()))
-    use = lambda x, value: (~x)(value) if isinstance(x, XObject) else x
-
-    @wraps(func, assigned=filter(partial(hasattr, func), WRAPPER_ASSIGNMENTS))
-    def xpartially_applied(*func_args, **func_kwargs):
-        if any_x:
-            if not func_args:
-                raise ValueError('Function "%s" partially applied with an '
-                    'X placeholder but called with no positional arguments.'
-                    % get_name(func))
-            first = func_args[0]
-            rest = func_args[1:]
-            args = tuple(use(x, first) for x in xargs) + rest
-            kwargs = dict((k, use(x, first)) for k, x in dict_items(xkwargs))
-            kwargs.update(func_kwargs)
-        else:
-            args = xargs + func_args
-            kwargs = dict(xkwargs, **func_kwargs)
-        return func(*args, **kwargs)
-
-    name = lambda: '%s(%s)' % (get_name(func), repr_args(*xargs, **xkwargs))
-    return set_name(name, xpartially_applied)
+    constants = []
+    function = constant_name(func, constants)
+    args = ''.join(_xpartial_arg(arg, constants) + ', ' for arg in xargs)
+    args += '*args[1:]' if any_x else '*args'
+    keywords = [(key, _xpartial_arg(value, constants)) for key, value in dict_items(xkwargs)]
+
+    body = []
+    if any_x:
+        body.append('if not args:\n    %s()\nx = args[0]' % constant_name(
+            partial(_no_arguments, func), constants))
+    if not keywords:
+        body.append('return %s(%s, **kwargs)' % (function, args))
+    else:
+        if all(_is_identifier(key) for key, _ in keywords):
+            body.append('if not kwargs:\n    return %s(%s%s)' % (
+                function, args, ''.join(', %s=%s' % keyword for keyword in keywords)))
+        # keyword arguments of the call override the partially applied ones
+        body.append('return %s(%s, **dict({%s}, **kwargs))' % (
+            function, args, ', '.join('%r: %s' % keyword for keyword in keywords)))
+    body = '\n'.join(body)
+    xpartially_applied = generated_function(body, constants, '*args, **kwargs')
+    wraps(func, assigned=filter(partial(hasattr, func), WRAPPER_ASSIGNMENTS))(
+        xpartially_applied)
+
+    return set_name(
+        LazyName(_xpartial_name, func, xargs, xkwargs), xpartially_applied)
+
+
+def _xpartial_arg(arg, constants):
+    if isinstance(arg, XObject):
+        return x_source(arg._operations, 'x', constants)
+    return constant_name(arg, constants)
+
+
+def _no_arguments(func):
+    raise ValueError('Function "%s" partially applied with an '
+        'X placeholder but called with no positional arguments.'
+        % get_name(func))
+
+
+def _xpartial_name(func, args, kwargs):
+    return '%s(%s)' % (get_name(func), repr_args(*args, **kwargs))
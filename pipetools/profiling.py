@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from threading import Lock, local
+
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+
+from io import IOBase
+
+import pipetools.main
+from pipetools.main import unfused
+from pipetools.compat import dict_items, perf_counter
+from pipetools.debug import get_name
+
+
+class Profile(object):
+    """
+    Statistics of pipe stages executed while profiling (see :func:`profile`),
+    collected per stage name.
+
+    ``print(profile)`` shows them as a table, :meth:`as_dict` returns them
+    for further processing.
+    """
+
+    def __init__(self):
+        self.stats = OrderedDict()
+        self._instrumented = {}
+        self._lock = Lock()
+        self._local = local()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = pipetools.main._profiler
+        pipetools.main._profiler = self
+        return self
+
+    def __exit__(self, *exc_info):
+        pipetools.main._profiler = self._previous
+        self._instrumented.clear()
+
+    def __str__(self):
+        return self.table()
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dict of stage name -> dict with the
+        number of ``calls``, ``cumulative`` and ``self`` time (in seconds)
+        and the number of ``exceptions`` raised.
+        """
+        return OrderedDict(
+            (name, dict(zip(('calls', 'cumulative', 'self', 'exceptions'), stats)))
+            for name, stats in dict_items(self.stats))
+
+    def table(self, sort_by='cumulative'):
+        """
+        Returns the statistics as a table sorted by `sort_by` (one of the
+        :meth:`as_dict` columns) in descending order.
+        """
+        column = ('calls', 'cumulative', 'self', 'exceptions').index(sort_by)
+        rows = sorted(self.stats.items(), key=lambda item: item[1][column], reverse=True)
+        return '\n'.join(
+            ['%10s %12s %12s %10s  %s' % ('calls', 'cumulative', 'self', 'exceptions', 'stage')] +
+            ['%10d %12.6f %12.6f %10d  %s' % (tuple(stats) + (name,)) for name, stats in rows])
+
+    def instrument(self, stages):
+        """
+        Returns `stages` of a pipe wrapped so they're measured, split into the
+        first one and the rest. Fused stages are replaced by the original ones,
+        so they're measured separately.
+        """
+        cached = self._instrumented.get(id(stages))
+        if cached is None or cached[0] is not stages:
+            instrumented = tuple(
+                self._stage(get_name(stage), stage) for stage in unfused(stages))
+            cached = self._instrumented[id(stages)] = (
+                stages, (instrumented[0], instrumented[1:]))
+        return cached[1]
+
+    def function(self, func):
+        """
+        Returns `func` of a single-stage pipe wrapped so it's measured.
+        """
+        cached = self._instrumented.get(id(func))
+        if cached is None or cached[0] is not func:
+            cached = self._instrumented[id(func)] = (func, self._stage(get_name(func), func))
+        return cached[1]
+
+    def _stage(self, name, stage):
+
+        def profiled_stage(*args, **kwargs):
+            result = self._measure(name, 1, stage, *args, **kwargs)
+            if isinstance(result, Iterator) and not isinstance(result, IOBase):
+                return self._iterate(name, result)
+            return result
+        return profiled_stage
+
+    def _iterate(self, name, iterator):
+        # time spent consuming lazy results belongs to the stage producing them
+        while True:
+            try:
+                item = self._measure(name, 0, next, iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def _measure(self, name, calls, function, *args, **kwargs):
+        nested = self._nested()
+        nested.append(0.0)
+        failed = False
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except StopIteration:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            own = elapsed - nested.pop()
+            if nested:
+                nested[-1] += elapsed
+            with self._lock:
+                stats = self.stats.get(name)
+                if stats is None:
+                    stats = self.stats[name] = [0, 0.0, 0.0, 0]
+                stats[0] += calls
+                stats[1] += elapsed
+                stats[2] += own
+                stats[3] += failed
+
+    def _nested(self):
+        # time spent in stages called by the currently measured ones (per thread)
+        try:
+            return self._local.nested
+        except AttributeError:
+            nested = self._local.nested = []
+            return nested
+
+
+def profile():
+    """
+    Context manager measuring all the pipe stages executed inside it:
+    how many times each was called, their cumulative time, self time
+    (excluding other stages executed within them, like a pipe inside
+    :func:`~pipetools.utils.foreach`) and the number of exceptions raised.
+
+    Stages returning iterators (e.g. :func:`~pipetools.utils.foreach`,
+    :func:`~pipetools.utils.where`) are also credited with the time spent
+    consuming them later.
+
+    >>> with profile() as stats:
+    ...     result = data > pipe | where(X.active) | foreach(process) | list
+    >>> print(stats)
+         calls   cumulative         self exceptions  stage
+             1     0.412312     0.004101          0  list
+             1     0.408211     0.401324          0  foreach(process)
+             1     0.006887     0.006887          0  where(X.active)
+
+    Pipes (including single functions like ``data > foreach(parse)``)
+    check for a profiler when called, so only pipes called while
+    profiling are affected, but the measured stages run somewhat slower
+    (lazy stages, which are normally fused into one, run separately).
+    """
+    return Profile()
@@ -1,18 +1,53 @@
 from __future__ import print_function
 try:
-    from collections.abc import Mapping
+    from collections.abc import Iterator, Mapping
 except ImportError:
-    from collections import Mapping
-
-from functools import partial, wraps
-from itertools import islice, takewhile, dropwhile
+    from collections import Iterator, Mapping
+
+from collections import deque, namedtuple, OrderedDict
+from functools import partial, reduce, wraps
+from gzip import GzipFile
+from heapq import nlargest, nsmallest
+from itertools import chain, groupby, islice, takewhile
+from locale import getpreferredencoding
+from mmap import mmap as MemoryMap, ACCESS_READ
+from multiprocessing import cpu_count
+from numbers import Integral
+from threading import Lock, Thread
+import csv
+import io
 import operator
-
-from pipetools.compat import map, filter, range, dict_items
-from pipetools.debug import set_name, repr_args, get_name
+import pickle
+import re
+import sys
+from tempfile import TemporaryFile
+
+from pipetools.compat import map, filter, range, dict_items, monotonic
+from pipetools.compat import string_types, text_type, Queue, NativeStringIO, merge
+from pipetools.debug import set_name, repr_args, get_name, LazyName, util_name
 from pipetools.decorators import data_structure_builder, regex_condition
+from pipetools.decorators import regex_matcher
 from pipetools.decorators import pipe_util, auto_string_formatter
-from pipetools.main import pipe, X, _iterable
+from pipetools.ds_builder import DSBuilder, NoBuilder
+from pipetools.main import pipe, X, _iterable, prepare_function_for_pipe
+from pipetools.main import XObject, generated_function, x_source, constant_name
+from pipetools.main import StringFormatter, xfunction, xpartial
+
+
+__all__ = [
+    'KEY', 'VALUE',
+    'foreach', 'foreach_parallel', 'foreach_do', 'foreach_batch',
+    'where', 'where_not', 'sort_by', 'sort', 'debug_print', 'tee',
+    'broadcast', 'fanout', 'as_args', 'as_kwargs', 'cached',
+    'take_first', 'drop_first', 'slice_items', 'batch', 'batch_by',
+    'unless', 'select_first', 'first_of', 'group_by', 'flatten', 'count',
+    'total', 'minimum', 'maximum', 'minmax', 'mean_var', 'histogram',
+    'reduce_all', 'take_until', 'take_until_including',
+    'read_records', 'read_lines', 'write_lines', 'to_file', 'to_csv',
+    # exported by earlier versions
+    'pipe_util', 'auto_string_formatter', 'data_structure_builder',
+    'regex_condition', 'regex_matcher', 'set_name', 'get_name', 'repr_args',
+]
 
 
 KEY, VALUE = X[0], X[1]
@@ -28,8 +63,118 @@ def foreach(function):
 
     >>> range(5) > foreach(factorial) | list
     [1, 1, 2, 6, 24]
+
+    The function can be applied in parallel using a pool of threads or
+    processes (see :func:`foreach_parallel`)::
+
+        urls > foreach(fetch).parallel(workers=8) | list
+
+    If `function` is an ``X`` expression consisting only of arithmetic
+    operators and comparisons and the input is a NumPy array, the expression
+    is evaluated on the whole array at once (returning an array)::
+
+        >>> numpy.arange(5) > foreach(X * 2 + 1)
+        array([1, 3, 5, 7, 9])
+    """
+    f = partial(
+        _vectorized_map if getattr(function, 'elementwise', False) else map,
+        function)
+    f.attrs = {'parallel': partial(foreach_parallel, function)}
+    return _lazy(f, 'map', function)
+
+
+@auto_string_formatter
+@data_structure_builder
+def foreach_parallel(function, **kwargs):
     """
-    return partial(map, function)
+    Like :func:`foreach`, but `function` is applied using a pool of
+    `workers` threads or processes (`mode` is ``'thread'`` or ``'process'``).
+    These options are keyword-only: `workers` (``None`` - the executor's
+    default), `mode` (``'thread'``), `chunksize` (1) and `ordered` (``True``).
+
+    The input is still consumed lazily - only a bounded number of chunks of
+    `chunksize` items is being processed at any time. With ``ordered=False``
+    the results are yielded as soon as they are ready.
+
+    The pools are shared by all pipes using the same `mode` and `workers`.
+
+    >>> range(5) > foreach_parallel(X * 2, workers=2) | list
+    [0, 2, 4, 6, 8]
+
+    In ``'process'`` mode `function` needs to be picklable (so not a lambda
+    or an ``X`` expression).
+    """
+    workers = kwargs.pop('workers', None)
+    mode = kwargs.pop('mode', 'thread')
+    chunksize = kwargs.pop('chunksize', 1)
+    ordered = kwargs.pop('ordered', True)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: %s' % ', '.join(kwargs))
+    if mode not in _executor_types:
+        raise ValueError('Unknown mode %r, use one of: %s' % (
+            mode, ', '.join(sorted(_executor_types))))
+    if workers is not None:
+        _check_size('workers', workers)
+    _check_size('chunksize', chunksize)
+    function = prepare_function_for_pipe(function)
+    max_pending = 2 * (workers or cpu_count() or 1)
+
+    def _foreach_parallel(iterable):
+        return _parallel_map(
+            function, iterable, _executor(mode, workers), chunksize, ordered,
+            max_pending)
+
+    name = LazyName(util_name, 'foreach_parallel', function, (), dict(
+        workers=workers, mode=mode, chunksize=chunksize, ordered=ordered))
+    return pipe | set_name(name, _foreach_parallel)
+
+
+_executor_types = {
+    'thread': 'ThreadPoolExecutor',
+    'process': 'ProcessPoolExecutor',
+}
+_executors = {}
+_executors_lock = Lock()
+
+
+def _executor(mode, workers):
+    with _executors_lock:
+        executor = _executors.get((mode, workers))
+        if executor is None:
+            import concurrent.futures
+            executor_type = getattr(concurrent.futures, _executor_types[mode])
+            executor = _executors[mode, workers] = executor_type(workers)
+        return executor
+
+
+def _apply_to_chunk(function, chunk):
+    return [function(item) for item in chunk]
+
+
+def _parallel_map(function, iterable, executor, chunksize, ordered, max_pending):
+    from concurrent.futures import wait, FIRST_COMPLETED
+
+    items = iter(iterable)
+    chunks = iter(lambda: list(islice(items, chunksize)), [])
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_apply_to_chunk, function, chunk))
+            while len(pending) >= max_pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    pending = deque(not_done)
+                for future in done:
+                    for result in future.result():
+                        yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+    finally:
+        for future in pending:
+            future.cancel()
 
 
 @pipe_util
@@ -62,8 +207,159 @@ def where(condition):
     >>> odd_range(10)
     [1, 3, 5, 7, 9]
 
+    With a :ref:`regex condition <auto-regex>` on a list of strings, the
+    items are first tested in large blocks joined into one string, so blocks
+    with no possible match are skipped without testing each item.
+
+    Like with :func:`foreach`, element-wise ``X`` conditions are evaluated
+    on a whole (one-dimensional) NumPy array at once, which is then masked::
+
+        >>> numpy.arange(10) > where(X % 3 == 0)
+        array([0, 3, 6, 9])
     """
-    return partial(filter, condition)
+    if getattr(condition, 'elementwise', False):
+        return _lazy(partial(_vectorized_filter, condition, True), 'filter', condition)
+    prefilter = _regex_prefilter(condition)
+    if prefilter:
+        return _lazy(partial(_regex_filter, condition, prefilter), 'filter', condition)
+    return _lazy(partial(filter, condition), 'filter', condition)
+
+
+def _array(iterable, min_dimensions=1):
+    """
+    Returns numpy if `iterable` is a numpy array (without importing numpy if
+    it hasn't been imported yet, in which case it can't be).
+    """
+    numpy = sys.modules.get('numpy')
+    if (numpy is not None and isinstance(iterable, numpy.ndarray)
+            and iterable.ndim >= min_dimensions):
+        return numpy
+
+
+def _vectorized_map(function, iterable):
+    if _array(iterable):
+        return function(iterable)
+    return map(function, iterable)
+
+
+def _vectorized_filter(condition, keep, iterable):
+    numpy = _array(iterable)
+    if numpy is None or iterable.ndim > 1:
+        return filter(condition if keep else pipe | condition | operator.not_, iterable)
+    mask = numpy.asarray(condition(iterable), dtype=bool)
+    return iterable[mask if keep else ~mask]
+
+
+# patterns that can match an item on its own but not within the joined block
+_unsafe_for_prefilter = r'\A', r'\Z', '(?<', '(?=', '(?!'
+
+_PREFILTER_BLOCK_SIZE = 1000
+
+
+def _regex_prefilter(condition):
+    regex = getattr(condition, 'regex', None)
+    if regex is None:
+        return None
+    source = regex.pattern
+    if isinstance(source, bytes):
+        source = source.decode('latin-1')
+    if any(unsafe in source for unsafe in _unsafe_for_prefilter):
+        return None
+    # for every item matching on its own, there's a match in the block
+    # (starting at that item) when ^ and $ match at line boundaries;
+    # a leading ^ is dropped altogether as anchored search is much slower
+    pattern = regex.pattern
+    if source.startswith('^'):
+        pattern = pattern[1:]
+    return re.compile(pattern, regex.flags | re.MULTILINE).search
+
+
+def _regex_filter(condition, prefilter, iterable):
+    if isinstance(iterable, _Records):
+        if getattr(condition, 'method', 'match') == 'search':
+            return _searched(condition, prefilter, False, iterable.blocks())
+        search = _line_search(condition.regex)
+        if search is None:
+            return filter(condition, iterable)
+        return _searched(condition, search, True, iterable.blocks())
+    if not isinstance(iterable, list):
+        return filter(condition, iterable)
+    return _prefiltered(condition, prefilter, _joined_blocks(iterable))
+
+
+def _joined_blocks(items):
+    for start in range(0, len(items), _PREFILTER_BLOCK_SIZE):
+        block = items[start:start + _PREFILTER_BLOCK_SIZE]
+        try:
+            separator = b'\n' if isinstance(block[0], bytes) else u'\n'
+            joined = separator.join(block)
+        except TypeError:
+            # not all strings or bytes, the items will be tested one by one
+            joined = None
+        yield joined, block
+
+
+def _prefiltered(condition, prefilter, blocks):
+    for joined, items in blocks:
+        try:
+            if joined is not None and not prefilter(joined):
+                continue
+        except TypeError:
+            # e.g. a str pattern and bytes items
+            pass
+        for item in filter(condition, items):
+            yield item
+
+
+def _line_search(regex):
+    # for match and fullmatch: anchored at the newline before a line, which
+    # is much faster than searching anywhere or using ^
+    pattern = regex.pattern
+    if isinstance(pattern, bytes):
+        pattern = b'\\n(?:' + pattern + b')'
+    else:
+        pattern = u'\\n(?:' + pattern + u')'
+    try:
+        return re.compile(pattern, regex.flags | re.MULTILINE).search
+    except re.error:
+        # e.g. global flags in the pattern
+        return None
+
+
+def _searched(condition, search, anchored, blocks):
+    # the records of a block are its lines, a line matching on its own
+    # is found by the search (at the newline before it if `anchored`,
+    # anywhere in it otherwise), so only the found ones need to be tested
+    for text, lines in blocks:
+        if text is None:
+            for line in filter(condition, lines):
+                yield line
+            continue
+        newline = b'\n' if isinstance(text, bytes) else u'\n'
+        text = newline + text
+        end = len(text) - text.endswith(newline)
+        position = 0 if anchored else 1
+        while True:
+            try:
+                match = search(text, position, end)
+            except TypeError:
+                # e.g. a str pattern and bytes lines
+                for line in filter(condition, _records((text[1:], lines))):
+                    yield line
+                break
+            if match is None:
+                break
+            if anchored:
+                start = match.start() + 1
+                stop = text.find(newline, start, end)
+            else:
+                start = text.rfind(newline, 0, match.start()) + 1
+                stop = text.find(newline, match.start(), end)
+            stop = end if stop == -1 else stop
+            line = text[start:stop]
+            if condition(line):
+                yield line
+            position = stop if anchored else stop + 1
 
 
 @pipe_util
@@ -72,7 +368,78 @@ def where_not(condition):
     """
     Inverted :func:`where`.
     """
-    return partial(filter, pipe | condition | operator.not_)
+    if getattr(condition, 'elementwise', False):
+        return _lazy(partial(_vectorized_filter, condition, False), 'filter_not', condition)
+    return _lazy(partial(filter, pipe | condition | operator.not_), 'filter_not', condition)
+
+
+# Adjacent lazy utils (foreach, where, where_not, take_first, take_until)
+# in a pipe are fused into a single generator doing all their steps for
+# each item, instead of a chain of iterators each item has to pass through.
+# Their stages are described by steps - (kind, argument, stage) tuples.
+
+def _lazy(f, kind, argument):
+    step = kind, argument, f
+    f.__pipetools__fuse__ = partial(_fuse_lazy, (step,))
+    return f
+
+
+def _fuse_lazy(steps, stage):
+    fuse = getattr(stage, '__pipetools__fuse__', None)
+    if type(fuse) is not partial or fuse.func is not _fuse_lazy:
+        return None
+    steps += fuse.args[0]
+    kinds = [kind for kind, _, _ in steps]
+    takes = [index for index, kind in enumerate(kinds) if kind == 'take']
+    if takes and set(kinds[:takes[-1]]) - set(['map', 'take']):
+        # only the input can be cut short exactly like islice does (without
+        # getting the next item), so no take_first can follow a filter
+        return None
+
+    generator = _generate_lazy(steps)
+    special_input = _special_inputs.get(steps[0][2].func)
+
+    def fused(iterable):
+        if special_input and special_input(iterable):
+            # e.g. a NumPy array, which the first stage handles at once
+            for _, _, stage in steps:
+                iterable = stage(iterable)
+            return iterable
+        # iter() so a non-iterable input fails right away, like unfused
+        return generator(iter(iterable))
+
+    fused.__pipetools__fuse__ = partial(_fuse_lazy, steps)
+    return fused
+
+
+# inputs the first stage would handle in a special way when not fused
+_special_inputs = {
+    _vectorized_map: _array,
+    _vectorized_filter: _array,
+    _regex_filter: lambda iterable: isinstance(iterable, (list, _Records)),
+}
+
+
+def _generate_lazy(steps):
+    constants = []
+    counts = [argument for kind, argument, _ in steps if kind == 'take']
+    source = 'x' if not counts else '%s(x, %s)' % (
+        constant_name(islice, constants), constant_name(min(counts), constants))
+    body = ['for item in %s:' % source]
+    for kind, argument, _ in steps:
+        if kind == 'take':
+            continue
+        if hasattr(argument, 'x_operations'):
+            value = x_source(argument.x_operations, 'item', constants)
+        else:
+            value = constant_name(argument, constants) + '(item)'
+        body.append(
+            '    item = %s' % value if kind == 'map' else
+            '    if not %s:\n        continue' % value if kind == 'filter' else
+            '    if %s:\n        continue' % value if kind == 'filter_not' else
+            '    if %s:\n        return' % value)
+    body.append('    yield item')
+    return generated_function('\n'.join(body), constants)
 
 
 @pipe_util
@@ -97,15 +464,150 @@ def sort_by(function):
 
     >>> 'asdfaSfa' > sort_by(X.lower()).descending
     ['s', 'S', 'f', 'f', 'd', 'a', 'a', 'a']
+
+    When only the first or last few items of the sorted sequence are needed,
+    ``.top(count)`` and ``.bottom(count)`` find them without sorting all of
+    it (in ``O(n log count)`` time):
+
+    >>> range(10) > sort_by(X % 5).descending.top(3)
+    [4, 9, 3]
+
+    ``sort_by(...) | take_first(count)`` in a pipe does the same.
+
+    Sequences too big to fit into memory can be sorted with
+    ``.external(max_items_in_memory=100000, tmpdir=None)``. It sorts runs of
+    `max_items_in_memory` items, stores them in temporary files (in `tmpdir`)
+    and returns an iterator lazily merging them. To limit the number of open
+    files, at most 100 of them are merged at once, into larger ones if needed::
+
+        events > sort_by(X.timestamp).external(tmpdir='/scratch') | foreach(process)
+
+    The items (and not just the keys) have to be picklable.
     """
     f = partial(sorted, key=function)
-    f.attrs = {'descending': _descending_sort_by(function)}
+    f.attrs = {
+        'descending': _descending_sort_by(function),
+        'top': partial(_sort_by_top, function, False),
+        'bottom': partial(_sort_by_bottom, function, False),
+        'external': partial(_external_sort_by, function, False),
+    }
+    f.__pipetools__fuse__ = partial(_fuse_sort_by, function, False)
     return f
 
 
 @pipe_util
 def _descending_sort_by(function):
-    return partial(sorted, key=function, reverse=True)
+    f = partial(sorted, key=function, reverse=True)
+    f.attrs = {
+        'top': partial(_sort_by_top, function, True),
+        'bottom': partial(_sort_by_bottom, function, True),
+        'external': partial(_external_sort_by, function, True),
+    }
+    f.__pipetools__fuse__ = partial(_fuse_sort_by, function, True)
+    return f
+
+
+def _sort_by_top(function, reverse, count):
+    f = partial(nlargest if reverse else nsmallest, count, key=function)
+    return pipe | set_name(LazyName(_sort_by_name, function, reverse, 'top', (count,), {}), f)
+
+
+def _sort_by_bottom(function, reverse, count):
+    def sort_by_bottom(iterable):
+        # the indexes keep the order of equal items the same as in a sort
+        if reverse:
+            decorated = nsmallest(count, (
+                (function(item), -i, item) for i, item in enumerate(iterable)))
+        else:
+            decorated = nlargest(count, (
+                (function(item), i, item) for i, item in enumerate(iterable)))
+        return [item for _, _, item in reversed(decorated)]
+
+    name = LazyName(_sort_by_name, function, reverse, 'bottom', (count,), {})
+    return pipe | set_name(name, sort_by_bottom)
+
+
+_EXTERNAL_RUN_SIZE = 100000
+_SPILL_BLOCK_SIZE = 1000
+# temporary files (open at the same time) merged at once
+_MAX_MERGED_RUNS = 100
+
+
+def _external_sort_by(function, reverse, max_items_in_memory=_EXTERNAL_RUN_SIZE, tmpdir=None):
+    _check_size('max_items_in_memory', max_items_in_memory)
+
+    def merged(runs):
+        return merge(*map(_unspill, runs), key=function, reverse=reverse)
+
+    def external_sort_by(iterable):
+        # levels of runs merged from the same number of runs (older first
+        # within a level, higher levels are older), when a level is full,
+        # it's merged into a run of the next one
+        levels = [[]]
+        try:
+            for run in _batches(iterable, max_items_in_memory):
+                run.sort(key=function, reverse=reverse)
+                levels[0].append(_spill(run, tmpdir))
+                level = 0
+                while len(levels[level]) == _MAX_MERGED_RUNS:
+                    if level + 1 == len(levels):
+                        levels.append([])
+                    levels[level + 1].append(_spill(merged(levels[level]), tmpdir))
+                    levels[level] = []
+                    level += 1
+            # in the original order, so equal items stay in it
+            levels = [[run for runs in reversed(levels) for run in runs]]
+            while len(levels[0]) > _MAX_MERGED_RUNS:
+                runs = levels[0]
+                levels[0] = [_spill(merged(runs[:_MAX_MERGED_RUNS]), tmpdir)] + runs[_MAX_MERGED_RUNS:]
+        except BaseException:
+            for runs in levels:
+                for f in runs:
+                    f.close()
+            raise
+        return merged(levels[0])
+
+    name = LazyName(_sort_by_name, function, reverse, 'external', (), dict(
+        max_items_in_memory=max_items_in_memory, tmpdir=tmpdir))
+    return pipe | set_name(name, external_sort_by)
+
+
+def _spill(items, tmpdir):
+    f = TemporaryFile(dir=tmpdir)
+    for block in _batches(items, _SPILL_BLOCK_SIZE):
+        pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _unspill(f):
+    try:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            for item in block:
+                yield item
+    finally:
+        f.close()
+
+
+def _sort_by_name(function, reverse, method, args, kwargs):
+    return '%s%s.%s(%s)' % (
+        util_name('sort_by', function, (), {}),
+        '.descending' if reverse else '', method, repr_args(*args, **kwargs))
+
+
+def _fuse_sort_by(function, reverse, stage):
+    # sort_by(...) | take_first(n) only needs the first n items
+    if type(stage) is partial and stage.func is _take_first and stage.args[0] is not None:
+        return partial(_top_items, function, reverse, stage.args[0])
+
+
+def _top_items(function, reverse, count, iterable):
+    select = nlargest if reverse else nsmallest
+    return iter(select(count, iterable, key=function))
 
 
 sort = sort_by(X)
@@ -144,6 +646,136 @@ def tee(function):
     return _tee
 
 
+def broadcast(*functions, **kwargs):
+    """
+    Feeds the input iterable to all the `functions` (e.g. pipes) in a single
+    pass, without storing it, and returns a tuple of their results.
+
+    >>> lines > broadcast(count, where(X.startswith('ERROR')) | count, foreach(len) | max)
+    (1034, 12, 180)
+
+    The first function runs in the current thread, the others in their own
+    threads, reading the items as they come through bounded buffers of at
+    most `buffer_size` items (10000 by default), so the slowest one sets
+    the pace. Lazy results (e.g. of :func:`foreach`) are turned into lists,
+    as they can't be consumed after the input is gone.
+    """
+    buffer_size = kwargs.pop('buffer_size', _BROADCAST_BUFFER_SIZE)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: %s' % ', '.join(kwargs))
+    if not functions:
+        raise TypeError('broadcast needs at least one function')
+    _check_size('buffer_size', buffer_size)
+    functions = list(map(prepare_function_for_pipe, functions))
+
+    def _broadcast(iterable):
+        return tuple(_broadcast_to(functions, iterable, buffer_size))
+
+    name = LazyName(_broadcast_name, functions)
+    return pipe | set_name(name, _broadcast)
+
+
+def fanout(definition, buffer_size=None):
+    """
+    Like :func:`broadcast`, but for a dict of functions, returning a dict
+    of their results.
+
+    >>> lines > fanout({'lines': count, 'errors': where(X.startswith('ERROR')) | count})
+    {'lines': 1034, 'errors': 12}
+    """
+    keys = list(definition)
+    f = broadcast(*[definition[key] for key in keys],
+                  buffer_size=_BROADCAST_BUFFER_SIZE if buffer_size is None else buffer_size)
+
+    def _fanout(iterable):
+        return dict(zip(keys, f(iterable)))
+
+    name = LazyName(_fanout_name, definition)
+    return pipe | set_name(name, _fanout)
+
+
+_BROADCAST_BUFFER_SIZE = 10000
+_BROADCAST_CHUNK_SIZE = 1000
+
+# marks the end of the input in consumers' queues
+_end = object()
+
+
+def _broadcast_to(functions, iterable, buffer_size):
+    chunk_size = min(_BROADCAST_CHUNK_SIZE, buffer_size)
+    chunks = _batches(iterable, chunk_size)
+    queues = [Queue(max(1, buffer_size // chunk_size)) for _ in functions[1:]]
+    consumers = [_Consumer(function, queue) for function, queue in zip(functions[1:], queues)]
+
+    def feed():
+        for chunk in chunks:
+            for queue in queues:
+                queue.put(chunk)
+            for item in chunk:
+                yield item
+
+    try:
+        results = [_materialized(functions[0](feed()))]
+        # the other functions may still want the rest
+        for chunk in chunks:
+            for queue in queues:
+                queue.put(chunk)
+    finally:
+        for queue in queues:
+            queue.put(_end)
+        for consumer in consumers:
+            consumer.join()
+
+    for consumer in consumers:
+        if consumer.error is not None:
+            raise consumer.error
+        results.append(consumer.result)
+    return results
+
+
+class _Consumer(Thread):
+
+    def __init__(self, function, queue):
+        super(_Consumer, self).__init__()
+        self.daemon = True
+        self.function, self.queue = function, queue
+        self.result = self.error = None
+        self.finished = False
+        self.start()
+
+    def run(self):
+        try:
+            self.result = _materialized(self.function(self.items()))
+        except Exception as error:
+            self.error = error
+        finally:
+            # keep taking the input until it ends, so it's not blocked
+            while not self.finished:
+                self.finished = self.queue.get() is _end
+
+    def items(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is _end:
+                self.finished = True
+                return
+            for item in chunk:
+                yield item
+
+
+def _materialized(result):
+    return list(result) if isinstance(result, Iterator) else result
+
+
+def _broadcast_name(functions):
+    return 'broadcast(%s)' % ', '.join(map(get_name, functions))
+
+
+def _fanout_name(definition):
+    return 'fanout({%s})' % ', '.join(
+        '%r: %s' % (key, get_name(value)) for key, value in dict_items(definition))
+
+
 @pipe_util
 def as_args(function):
     """
@@ -164,6 +796,116 @@ def as_kwargs(function):
     return lambda x: function(**x)
 
 
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+
+def cached(function, maxsize=128, ttl=None, key=None):
+    """
+    Remembers results of `function` for the last `maxsize` distinct inputs
+    (or all of them if `maxsize` is ``None``), optionally only for `ttl`
+    seconds.
+
+    Inputs are looked up by the result of `key` (which can be an ``X``
+    expression or a :ref:`data-structure definition <auto-ds-creation>`,
+    whose lists and dicts are built as tuples, so the keys are hashable)
+    or by themselves if it's not given. Unhashable inputs without a `key`
+    are not cached.
+
+    >>> get_user = pipe | cached(fetch_user, key=X['id']) | X.name
+
+    The statistics are available via ``cache_info()``, ``cache_clear()``
+    empties the cache::
+
+        >>> f = cached(expensive)
+        >>> [1, 2, 1, 1] > foreach(f) | list
+        >>> f.cache_info()
+        CacheInfo(hits=2, misses=2, evictions=0, maxsize=128, currsize=2)
+    """
+    cached_function = _function(function)
+    key_function = None if key is None else _function(_hashable_definition(key))
+    cache = OrderedDict()
+    stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    lock = Lock()
+
+    def _cached(thing):
+        cache_key = thing if key_function is None else key_function(thing)
+        now = None if ttl is None else monotonic()
+        with lock:
+            try:
+                value, expires = cache[cache_key]
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable
+                cache_key = _unhashable
+            else:
+                if expires is None or expires > now:
+                    cache[cache_key] = cache.pop(cache_key)
+                    stats['hits'] += 1
+                    return value
+                del cache[cache_key]
+                stats['evictions'] += 1
+            stats['misses'] += 1
+
+        value = cached_function(thing)
+        if cache_key is _unhashable:
+            return value
+
+        with lock:
+            cache[cache_key] = value, None if ttl is None else now + ttl
+            if maxsize is not None and len(cache) > maxsize:
+                cache.popitem(last=False)
+                stats['evictions'] += 1
+        return value
+
+    def cache_info():
+        with lock:
+            return CacheInfo(maxsize=maxsize, currsize=len(cache), **stats)
+
+    def cache_clear():
+        with lock:
+            cache.clear()
+            stats.update(hits=0, misses=0, evictions=0)
+
+    name = LazyName(_cached_name, function, maxsize, ttl, key)
+    result = pipe | set_name(name, _cached)
+    result.cache_info = cache_info
+    result.cache_clear = cache_clear
+    return result
+
+
+_unhashable = object()
+
+
+def _hashable_definition(definition):
+    # e.g. [X.a, X.b] as (X.a, X.b) and {'a': X.a} as (('a', X.a),)
+    if isinstance(definition, (list, tuple)):
+        return tuple([_hashable_definition(d) for d in definition])
+    if isinstance(definition, dict):
+        return tuple([(k, _hashable_definition(v)) for k, v in dict_items(definition)])
+    return definition
+
+
+def _cached_name(function, maxsize, ttl, key):
+    return 'cached(%s)' % ', '.join(filter(None, (
+        get_name(function),
+        repr_args(maxsize=maxsize, ttl=ttl) if ttl is not None else
+        repr_args(maxsize=maxsize),
+        'key=%s' % get_name(key) if key is not None else None)))
+
+
+def _function(thing):
+    """
+    Turns `thing` into a function the same way pipe-utils do with their
+    function argument.
+    """
+    try:
+        thing = DSBuilder(thing)
+    except NoBuilder:
+        pass
+    return prepare_function_for_pipe(thing)
+
+
 def take_first(count):
     """
     Assumes an iterable on the input, returns an iterable with first `count`
@@ -173,9 +915,14 @@ def take_first(count):
     (0, 100, 200, 300, 400)
 
     """
-    def _take_first(iterable):
-        return islice(iterable, count)
-    return pipe | set_name('take_first(%s)' % count, _take_first)
+    f = partial(_take_first, count)
+    if count is not None:
+        _lazy(f, 'take', count)
+    return pipe | set_name('take_first(%s)' % count, f)
+
+
+def _take_first(count, iterable):
+    return islice(iterable, count)
 
 
 def drop_first(count):
@@ -186,13 +933,113 @@ def drop_first(count):
     >>> range(10) > drop_first(5) | tuple
     (5, 6, 7, 8, 9)
     """
+    # a negative count drops nothing, not all but the last items
+    start = max(count, 0)
+
     def _drop_first(iterable):
-        g = (x for x in range(1, count + 1))
-        return dropwhile(
-            lambda i: unless(StopIteration, lambda: next(g))(), iterable)
+        return _slice(iterable, start, None, None)
     return pipe | set_name('drop_first(%s)' % count, _drop_first)
 
 
+def slice_items(start, stop=None, step=None):
+    """
+    Assumes an iterable on the input, returns an iterable over the items
+    that would be in ``items[start:stop:step]`` if the input was a list.
+
+    >>> range(10) > slice_items(2, 8, 3) | tuple
+    (2, 5)
+
+    Negative values only work for sequences (like lists or tuples) which
+    are sliced directly instead of being iterated.
+    """
+    def _slice_items(iterable):
+        return _slice(iterable, start, stop, step)
+    name = 'slice_items(%s)' % repr_args(start, stop, step)
+    return pipe | set_name(name, _slice_items)
+
+
+def batch(size):
+    """
+    Assumes an iterable on the input, returns an iterator over lists of
+    `size` consecutive items (the last one can be shorter).
+
+    >>> range(7) > batch(3) | list
+    [[0, 1, 2], [3, 4, 5], [6]]
+    """
+    _check_size('size', size)
+
+    def _batch(iterable):
+        return _batches(iterable, size)
+    return pipe | set_name('batch(%s)' % size, _batch)
+
+
+def batch_by(function, max_weight):
+    """
+    Like :func:`batch`, but the size of the batches is limited by the total
+    weight of their items, as given by `function`. An item heavier than
+    `max_weight` makes a batch on its own.
+
+    >>> ['a', 'bcd', 'ef', 'g', 'hijkl'] > batch_by(len, 4) | list
+    [['a', 'bcd'], ['ef', 'g'], ['hijkl']]
+    """
+    weight_of = _function(function)
+
+    def _batch_by(iterable):
+        batch, weight = [], 0
+        for item in iterable:
+            item_weight = weight_of(item)
+            if batch and weight + item_weight > max_weight:
+                yield batch
+                batch, weight = [], 0
+            batch.append(item)
+            weight += item_weight
+        if batch:
+            yield batch
+
+    name = LazyName(util_name, 'batch_by', function, (max_weight,), {})
+    return pipe | set_name(name, _batch_by)
+
+
+def foreach_batch(function, size):
+    """
+    Like :func:`foreach`, but `function` is called on lists of `size`
+    items and returns an iterable of results for them. The results are
+    chained into a single lazy iterator.
+
+    Useful for bulk APIs or vectorized functions::
+
+        rows > foreach_batch(db.insert_many, 1000) | list
+    """
+    _check_size('size', size)
+    apply = _function(function)
+
+    def _foreach_batch(iterable):
+        return chain.from_iterable(map(apply, _batches(iterable, size)))
+
+    name = LazyName(util_name, 'foreach_batch', function, (size,), {})
+    return pipe | set_name(name, _foreach_batch)
+
+
+def _check_size(name, value):
+    # sizes of chunks the input is split into, which can't be empty
+    if not isinstance(value, Integral) or value < 1:
+        raise ValueError('%s must be an integer >= 1, not %r' % (name, value))
+
+
+def _batches(iterable, size):
+    items = iter(iterable)
+    return iter(lambda: list(islice(items, size)), [])
+
+
+_sliceable = list, tuple, range, bytes, string_types
+
+
+def _slice(iterable, start, stop, step):
+    if isinstance(iterable, _sliceable):
+        return iter(iterable[start:stop:step])
+    return islice(iterable, start, stop, step)
+
+
 def unless(exception_class_or_tuple, func, *args, **kwargs):
     """
     When `exception_class_or_tuple` occurs while executing `func`, it will
@@ -203,24 +1050,37 @@ def unless(exception_class_or_tuple, func, *args, **kwargs):
     12
     >>> f([1, 2, 3])
     None
-    """
-    @pipe_util
-    @auto_string_formatter
-    @data_structure_builder
-    def construct_unless(function):
-        # a wrapper so we can re-use the decorators
-        def _unless(*args, **kwargs):
-            try:
-                return function(*args, **kwargs)
-            except exception_class_or_tuple:
-                pass
-        return _unless
 
-    name = lambda: 'unless(%s, %s)' % (exception_class_or_tuple, ', '.join(
+    """
+    if isinstance(func, XObject):
+        func = xfunction(func)
+    if args or kwargs:
+        function = xpartial(func, *args, **kwargs)
+    elif isinstance(func, string_types):
+        function = StringFormatter(func)
+    else:
+        try:
+            function = DSBuilder(func)
+        except NoBuilder:
+            function = func
+    exceptions = (
+        exception_class_or_tuple if isinstance(exception_class_or_tuple, tuple)
+        else (exception_class_or_tuple,))
+
+    def _unless(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except exceptions:
+            return None
+
+    name = LazyName(_unless_name, exception_class_or_tuple, func, args, kwargs)
+    return pipe | set_name(name, _unless)
+
+
+def _unless_name(exception_class_or_tuple, func, args, kwargs):
+    return 'unless(%s, %s)' % (exception_class_or_tuple, ', '.join(
         filter(None, (get_name(func), repr_args(*args, **kwargs)))))
 
-    return set_name(name, construct_unless(func, *args, **kwargs))
-
 
 @pipe_util
 @regex_condition
@@ -246,7 +1106,20 @@ def select_first(condition):
     >>> first_of([])
     None
     """
-    return where(condition) | unless(StopIteration, next)
+    if condition is xfunction(X):
+        # test the items themselves
+        condition = None
+    elif hasattr(condition, 'x_operations'):
+        # a loop with the condition inlined
+        constants = []
+        return generated_function(
+            'for item in x:\n    if %s:\n        return item' % x_source(
+                condition.x_operations, 'item', constants),
+            constants)
+
+    def _select_first(iterable):
+        return next(filter(condition, iterable), None)
+    return _select_first
 
 
 first_of = select_first(X)
@@ -268,6 +1141,23 @@ def group_by(function):
 
     >>> [1, 2, 3, 4, 5, 6] > group_by(X % 2) | list
     [(0, [2, 4, 6]), (1, [1, 3, 5])]
+
+    If the input is already sorted by `function`, the groups can be streamed
+    as they are completed, without keeping the whole input in memory:
+
+    >>> [1, 3, 2, 4, 5] > group_by(X % 2).sorted | list
+    [(1, [1, 3]), (0, [2, 4]), (1, [5])]
+
+    Instead of collecting the items, each group can also be folded into
+    a single value by a `reducer` function of two arguments (starting with
+    `initial` if given, otherwise with the first item of the group), like
+    with :func:`functools.reduce`. This can be combined with ``.sorted``:
+
+    >>> [1, 2, 3, 4, 5, 6] > group_by(X % 2).aggregate(operator.add) | list
+    [(0, 12), (1, 9)]
+
+    >>> [1, 3, 2, 4, 5] > group_by(X % 2).sorted.aggregate(max) | list
+    [(1, 3), (0, 4), (1, 5)]
     """
     def _group_by(seq):
         result = {}
@@ -275,19 +1165,78 @@ def group_by(function):
             result.setdefault(function(item), []).append(item)
         return dict_items(result)
 
+    _group_by.attrs = {
+        'sorted': _sorted_group_by(function),
+        'aggregate': partial(_aggregate_group_by, function),
+    }
     return _group_by
 
 
-def _flatten(x):
-    if not _iterable(x) or isinstance(x, Mapping):
-        yield x
-    else:
-        for y in x:
-            for z in _flatten(y):
-                yield z
+@pipe_util
+def _sorted_group_by(function):
+    def sorted_group_by(seq):
+        return ((key, list(items)) for key, items in groupby(seq, function))
+
+    sorted_group_by.attrs = {
+        'aggregate': partial(_aggregate_sorted_group_by, function),
+    }
+    return sorted_group_by
 
 
-def flatten(*args):
+def _aggregate_group_by(function, reducer, *initial):
+    def aggregate_group_by(seq):
+        result = {}
+        for item in seq:
+            key = function(item)
+            if key in result:
+                result[key] = reducer(result[key], item)
+            else:
+                result[key] = reducer(initial[0], item) if initial else item
+        return dict_items(result)
+
+    name = LazyName(_aggregate_name, 'aggregate', function, reducer, initial)
+    return pipe | set_name(name, aggregate_group_by)
+
+
+def _aggregate_sorted_group_by(function, reducer, *initial):
+    def aggregate_sorted_group_by(seq):
+        return ((key, reduce(reducer, items, *initial))
+            for key, items in groupby(seq, function))
+
+    name = LazyName(_aggregate_name, 'sorted.aggregate', function, reducer, initial)
+    return pipe | set_name(name, aggregate_sorted_group_by)
+
+
+def _aggregate_name(method, function, reducer, initial):
+    return 'group_by(%s).%s(%s)' % (get_name(function), method, ', '.join(
+        chain([get_name(reducer)], map(repr, initial))))
+
+
+# types that are never flattened / always flattened, checked before the
+# slower general checks
+_leaf_types = frozenset([int, float, bool, complex, type(None), text_type, str])
+_sequence_types = frozenset([list, tuple])
+
+
+def _flatten(items, depth=None):
+    # an explicit stack of iterators, so each item is yielded from a single
+    # generator no matter how deep it's nested (and there's no recursion limit)
+    stack = [iter(items)]
+    while stack:
+        for item in stack[-1]:
+            cls = type(item)
+            if cls in _leaf_types or depth is not None and len(stack) > depth:
+                yield item
+            elif cls in _sequence_types or _iterable(item) and not isinstance(item, Mapping):
+                stack.append(iter(item))
+                break
+            else:
+                yield item
+        else:
+            stack.pop()
+
+
+def flatten(*args, **kwargs):
     """
     Flattens an arbitrarily deep nested iterable(s).
 
@@ -305,17 +1254,222 @@ def flatten(*args):
 
     >>> 'stuff' > flatten | list
     ['stuff']
+
+    Only some levels of nesting can be flattened with `depth`:
+
+    >>> [[1, [2]], 3] > flatten(depth=1) | list
+    [1, [2], 3]
     """
-    return _flatten(args)
+    depth = kwargs.pop('depth', None)
+    if kwargs:
+        raise TypeError('Unexpected keyword arguments: %s' % ', '.join(kwargs))
+    if depth is not None and not args:
+        return pipe | set_name(
+            LazyName('flatten(depth={0})'.format, depth), partial(flatten, depth=depth))
+    return _flatten(args, None if depth is None else depth + 1)
 flatten = wraps(flatten)(pipe | flatten)
 
 
 def count(iterable):
     """
     Returns the number of items in `iterable`.
+
+    It's also a reducer that can be combined with others by
+    :func:`reduce_all`.
     """
+    if type(iterable) in _sized_types:
+        return len(iterable)
     return sum(1 for whatever in iterable)
 count = wraps(count)(pipe | count)
+count.reducer = None, '{s0} = 0', '{s0} += 1', '{s0}', ()
+
+_sized_types = frozenset([list, tuple, dict, set, frozenset, range])
+
+
+# Reducers compute a value from the items of an iterable in one pass. They're
+# defined by a function to apply on each item (an X object or anything else
+# pipe-utils accept) and source code templates initializing their state
+# ({s0}, {s1}, ...), updating it with each value ({v}, using a temporary
+# variable {t} if needed) and making the result from it. Constants are
+# referred to as {c0}, {c1}, ... Code of several reducers is then generated
+# into a single loop (see reduce_all).
+
+def _reducer(util, function, init, step, result, constants=(), kwargs={}):
+    reducer = (
+        function if isinstance(function, XObject) else _function(function),
+        init, step, result, constants)
+    f = pipe | set_name(
+        LazyName(util_name, util, function, (), kwargs),
+        _reducers_function([reducer], 'results[0]'))
+    f.reducer = reducer
+    return f
+
+
+def total(function=X, start=0):
+    """
+    Returns a sum of `function` applied on all the items (and `start`).
+
+    >>> ['a', 'bb', 'ccc'] > total(len)
+    6
+    """
+    return _reducer(
+        'total', function, '{s0} = {c0}', '{s0} = {s0} + {v}', '{s0}', (start,),
+        kwargs={'start': start} if start != 0 else {})
+
+
+def minimum(function=X):
+    """
+    Returns the smallest value of `function` applied on the items.
+
+    >>> ['bb', 'a', 'ccc'] > minimum(len)
+    1
+    """
+    return _reducer(
+        'minimum', function, '{s0} = {c0}',
+        'if {s0} is {c0} or {v} < {s0}:\n    {s0} = {v}',
+        '{c1}({s0})', (_nothing, _checked))
+
+
+def maximum(function=X):
+    """
+    Returns the largest value of `function` applied on the items.
+
+    >>> ['bb', 'a', 'ccc'] > maximum(len)
+    3
+    """
+    return _reducer(
+        'maximum', function, '{s0} = {c0}',
+        'if {s0} is {c0} or {v} > {s0}:\n    {s0} = {v}',
+        '{c1}({s0})', (_nothing, _checked))
+
+
+def minmax(function=X):
+    """
+    Returns a tuple of the smallest and the largest value of `function`
+    applied on the items.
+
+    >>> [3, 1, 4, 1, 5] > minmax()
+    (1, 5)
+    """
+    return _reducer(
+        'minmax', function, '{s0} = {s1} = {c0}',
+        'if {s0} is {c0}:\n    {s0} = {s1} = {v}\n'
+        'elif {v} < {s0}:\n    {s0} = {v}\n'
+        'elif {v} > {s1}:\n    {s1} = {v}',
+        '({c1}({s0}), {s1})', (_nothing, _checked))
+
+
+def mean_var(function=X, ddof=0):
+    """
+    Returns a tuple of the mean and the variance of `function` applied on the
+    items, computed in one pass by Welford's algorithm. The variance is
+    divided by ``n - ddof`` (so ``ddof=1`` gives the sample variance).
+
+    >>> [2, 4, 4, 4, 5, 5, 7, 9] > mean_var()
+    (5.0, 4.0)
+    """
+    return _reducer(
+        'mean_var', function, '{s0} = 0\n{s1} = {s2} = 0.0',
+        '{s0} += 1\n{t} = {v} - {s1}\n{s1} += {t} / {s0}\n{s2} += {t} * ({v} - {s1})',
+        '{c0}({s0}, {s1}, {s2})', (partial(_mean_var, ddof),),
+        kwargs={'ddof': ddof} if ddof else {})
+
+
+def histogram(function=X):
+    """
+    Returns a dict of the values of `function` applied on the items and the
+    number of times each of them occurred.
+
+    >>> ['a', 'bb', 'cc', 'd', 'eee'] > histogram(len)
+    {1: 2, 2: 2, 3: 1}
+    """
+    return _reducer(
+        'histogram', function, '{s0} = {c0}()', '{s0}[{v}] = {s0}.get({v}, 0) + 1',
+        '{s0}', (dict,))
+
+
+_nothing = object()
+
+
+def _checked(value):
+    if value is _nothing:
+        raise ValueError('Reducing an empty sequence')
+    return value
+
+
+def _mean_var(ddof, n, mean, m2):
+    if n <= ddof:
+        raise ValueError('Not enough items for variance with ddof=%s' % ddof)
+    return mean, m2 / (n - ddof)
+
+
+def reduce_all(definition):
+    """
+    Computes all the reducers (like :func:`count`, :func:`total`,
+    :func:`minimum`, :func:`maximum`, :func:`minmax`, :func:`mean_var` or
+    :func:`histogram`) in a data-structure `definition` in a single pass over
+    the input, so it doesn't need to be stored in memory (or be read twice).
+
+    >>> range(10) > reduce_all({'n': count, 'max': maximum(X * 2), 'stats': [minmax(), total()]})
+    {'n': 10, 'max': 18, 'stats': [(0, 9), 45]}
+
+    Other functions (including pipes ending with a reducer, like
+    ``where(X % 2) | count``) can't be computed this way and raise
+    :class:`TypeError`, see :func:`broadcast` for those. The `definition`
+    can also be a single reducer.
+    """
+    name = LazyName(util_name, 'reduce_all', definition, (), {})
+    reducer = _reducer_of(definition)
+    if reducer is not None:
+        return pipe | set_name(name, _reducers_function([reducer], 'results[0]'))
+
+    reducers = []
+
+    def replace(definition):
+        reducer = _reducer_of(definition)
+        if reducer is not None:
+            reducers.append(reducer)
+            return X[len(reducers) - 1]
+        if isinstance(definition, (tuple, list)):
+            return type(definition)(map(replace, definition))
+        if isinstance(definition, dict):
+            return dict((key, replace(value)) for key, value in dict_items(definition))
+        if callable(definition):
+            raise TypeError('%s is not a reducer' % get_name(definition))
+        return definition
+
+    build = DSBuilder(replace(definition))
+    return pipe | set_name(name, _reducers_function(reducers, '_0(results)', [build]))
+
+
+def _reducer_of(thing):
+    if isinstance(thing, XObject):
+        # any attribute of X is an X expression
+        return None
+    reducer = getattr(thing, 'reducer', None)
+    return reducer if isinstance(reducer, tuple) else None
+
+
+def _reducers_function(reducers, result, constants=()):
+    constants = list(constants)
+    init, step, results = [], ['for item in x:'], []
+    for i, (function, init_source, step_source, result_source, reducer_constants) in enumerate(reducers):
+        names = dict(('s%d' % j, 'r%d_s%d' % (i, j)) for j in range(3))
+        names.update(('c%d' % j, constant_name(c, constants))
+                     for j, c in enumerate(reducer_constants))
+        names.update(v='r%d_v' % i, t='r%d_t' % i)
+        if function is not None:
+            step.append('    %s = %s' % (names['v'], x_source(function._operations, 'item', constants)
+                if isinstance(function, XObject) else
+                constant_name(function, constants) + '(item)'))
+        init.append(init_source.format(**names))
+        step.extend('    ' + line for line in step_source.format(**names).split('\n'))
+        results.append(result_source.format(**names))
+    if len(step) == 1:
+        step.append('    pass')
+    body = '\n'.join(init + step + ['results = (%s)' % ''.join(r + ', ' for r in results),
+                                    'return ' + result])
+    return generated_function(body, constants)
 
 
 @pipe_util
@@ -330,7 +1484,7 @@ def take_until(condition):
     """
     f = partial(takewhile, pipe | condition | operator.not_)
     f.attrs = {'including': take_until_including(condition)}
-    return f
+    return _lazy(f, 'until', condition)
 
 
 @pipe_util
@@ -348,3 +1502,294 @@ def take_until_including(condition):
                 yield i
                 break
     return take_until_including_
+
+
+_CHUNK_BYTES = 1 << 20
+
+
+def read_records(path, sep=b'\n', mmap=True, chunk_bytes=_CHUNK_BYTES, views=False):
+    """
+    Reads records separated by `sep` from a binary file, without the
+    separators.
+
+    The file is read in blocks of about `chunk_bytes` bytes (memory-mapped,
+    unless ``mmap=False``) which are split into records all at once. With
+    ``views=True`` the records are :class:`memoryview` slices of the
+    memory-mapped file, so they're not copied at all.
+
+    >>> read_records('events.bin', sep=b'\\0') > foreach(parse_event) | list
+
+    The result can be iterated repeatedly, reading the file again.
+    """
+    if views:
+        blocks = partial(_memoryview_blocks, path, sep, chunk_bytes)
+    else:
+        blocks = partial(_split_blocks, path, sep, mmap, chunk_bytes)
+    return _Records(path, blocks)
+read_records = wraps(read_records)(pipe | read_records)
+
+
+def read_lines(path, encoding=None, errors='strict', mmap=True, chunk_bytes=_CHUNK_BYTES):
+    """
+    Reads lines of a text file, without the line breaks.
+
+    Like :func:`read_records`, the file is read (and decoded) in large blocks,
+    which is much faster than iterating a file object. A
+    :ref:`regex condition <auto-regex>` in :func:`where` is searched for in
+    the whole blocks, so the lines without a match aren't even split off.
+
+    >>> read_lines('server.log') > where(r'.*ERROR') | foreach(parse) | list
+
+    Universal newlines are not supported (just ``\\n`` and ``\\r\\n``).
+    """
+    encoding = encoding or getpreferredencoding(False)
+    if u'\n'.encode(encoding) != b'\n':
+        # e.g. UTF-16, can't split the bytes on newlines
+        return _Records(path, partial(_text_file_blocks, path, encoding, errors))
+    return _Records(path, partial(
+        _decoded_blocks, partial(_split_blocks, path, b'\n', mmap, chunk_bytes),
+        encoding, errors))
+read_lines = wraps(read_lines)(pipe | read_lines)
+
+
+class _Records(object):
+    """
+    Records of a file, read in blocks.
+
+    `blocks` is a function returning an iterator over tuples of a block of
+    records joined by newlines (or ``None``) and a list of the records
+    (or ``None`` if they're the lines of the block, to split it only if needed).
+    """
+
+    def __init__(self, path, blocks):
+        self.path = path
+        self.blocks = blocks
+
+    def __iter__(self):
+        return chain.from_iterable(map(_records, self.blocks()))
+
+    def __repr__(self):
+        return 'records of %r' % (self.path,)
+
+
+def _block_ranges(path, sep, mmap, chunk_bytes):
+    """
+    Yields a buffer and a range in it of blocks of whole records.
+    """
+    with io.open(path, 'rb') as f:
+        data = _mapped(f) if mmap else None
+        if data is None:
+            for block in _read_blocks(f, sep, chunk_bytes):
+                yield block, 0, len(block)
+            return
+        try:
+            start, size = 0, len(data)
+            while start < size:
+                stop = data.rfind(sep, start, start + chunk_bytes)
+                if stop == -1:
+                    # a record longer than chunk_bytes
+                    stop = data.find(sep, start + chunk_bytes)
+                stop = size if stop == -1 else stop + len(sep)
+                yield data, start, stop
+                start = stop
+        finally:
+            try:
+                data.close()
+            except BufferError:
+                # memoryviews of it still exist, it's closed when they're gone
+                pass
+
+
+def _mapped(f):
+    try:
+        return MemoryMap(f.fileno(), 0, access=ACCESS_READ)
+    except (ValueError, EnvironmentError):
+        # an empty file or not a regular file
+        return None
+
+
+def _read_blocks(f, sep, chunk_bytes):
+    rest = b''
+    for chunk in iter(partial(f.read, chunk_bytes), b''):
+        chunk = rest + chunk
+        stop = chunk.rfind(sep)
+        if stop == -1:
+            rest = chunk
+            continue
+        stop += len(sep)
+        rest = chunk[stop:]
+        yield chunk[:stop]
+    if rest:
+        yield rest
+
+
+def _split_blocks(path, sep, mmap, chunk_bytes):
+    for data, start, stop in _block_ranges(path, sep, mmap, chunk_bytes):
+        if sep == b'\n':
+            yield data[start:stop], None
+        else:
+            # the searches in where only work with lines
+            yield None, _split(data[start:stop], sep)
+
+
+def _split(block, sep):
+    records = block.split(sep)
+    if not records[-1]:
+        records.pop()
+    return records
+
+
+def _records(block_and_records):
+    block, records = block_and_records
+    if records is None:
+        return _split(block, b'\n' if isinstance(block, bytes) else u'\n')
+    return records
+
+
+def _memoryview_blocks(path, sep, chunk_bytes):
+    for data, start, stop in _block_ranges(path, sep, True, chunk_bytes):
+        view = memoryview(data)
+        records = []
+        while start < stop:
+            end = data.find(sep, start, stop)
+            end = stop if end == -1 else end
+            records.append(view[start:end])
+            start = end + len(sep)
+        yield None, records
+
+
+def _decoded_blocks(blocks, encoding, errors):
+    for block, _ in blocks():
+        text = block.decode(encoding, errors)
+        if u'\r' in text:
+            text = text.replace(u'\r\n', u'\n')
+        yield text, None
+
+
+def _text_file_blocks(path, encoding, errors):
+    with io.open(path, encoding=encoding, errors=errors) as f:
+        for lines in _batches(f, _PREFILTER_BLOCK_SIZE):
+            lines = [line.rstrip(u'\r\n') for line in lines]
+            yield u'\n'.join(lines), lines
+
+
+def write_lines(path, encoding=None, errors='strict', chunk_bytes=_CHUNK_BYTES,
+                gzip=None, append=False):
+    """
+    Writes the items (strings, or bytes) to a file as lines and returns
+    the number of lines written.
+
+    The lines are joined (and encoded) into chunks of about `chunk_bytes`,
+    which are written at once, instead of writing them one by one.
+    The file is compressed with gzip if `gzip` is true, by default if its
+    name ends with ``.gz``.
+
+    >>> read_lines('server.log') > where(r'.*ERROR') | write_lines('errors.log.gz')
+    12
+    """
+    def _write_lines(iterable):
+        return _write_chunks(
+            path, _line_chunks(iterable), encoding, errors, chunk_bytes, gzip, append)
+    return pipe | set_name('write_lines(%r)' % (path,), _write_lines)
+
+
+def to_file(path, encoding=None, errors='strict', chunk_bytes=_CHUNK_BYTES,
+            gzip=None, append=False):
+    """
+    Like :func:`write_lines`, but writes the items as they are (without
+    newlines), e.g. data already serialized in chunks.
+
+    >>> records > foreach(serialize) | to_file('records.bin')
+    """
+    def _to_file(iterable):
+        return _write_chunks(
+            path, _joined_chunks(iterable), encoding, errors, chunk_bytes, gzip, append)
+    return pipe | set_name('to_file(%r)' % (path,), _to_file)
+
+
+def to_csv(path, row=None, header=None, encoding=None, errors='strict',
+           chunk_bytes=_CHUNK_BYTES, gzip=None, append=False, **fmtparams):
+    """
+    Writes the items as rows of a CSV file and returns the number of rows
+    written (not counting the `header`).
+
+    `row` makes a row of an item, like the function argument of
+    :func:`foreach` (so it's usually a tuple of X expressions), other keyword
+    arguments are passed to :func:`csv.writer`. Otherwise it works like
+    :func:`write_lines`.
+
+    >>> users > to_csv('users.csv', (X.name, X.email), header=('name', 'email'))
+    1203
+    """
+    make_row = None if row is None else _function(row)
+
+    def _to_csv(iterable):
+        chunks = _csv_chunks(header, map(make_row, iterable) if make_row else iterable,
+                             fmtparams)
+        return _write_chunks(path, chunks, encoding, errors, chunk_bytes, gzip, append)
+    return pipe | set_name('to_csv(%r)' % (path,), _to_csv)
+
+
+_GZIP_LEVEL = 6
+
+# items joined at once, before the chunks are joined into blocks
+_WRITE_BATCH_SIZE = 1000
+
+
+def _write_chunks(path, chunks, encoding, errors, chunk_bytes, gzip, append):
+    """
+    Writes `chunks` (tuples of data and how many items it represents)
+    joined into blocks of about `chunk_bytes`, returns the number of items.
+    """
+    encoding = encoding or getpreferredencoding(False)
+    if gzip is None:
+        gzip = str(path).endswith('.gz')
+    count = 0
+    with io.open(path, 'ab' if append else 'wb') as f:
+        out = GzipFile(fileobj=f, mode='wb', compresslevel=_GZIP_LEVEL) if gzip else f
+        try:
+            pending, size = [], 0
+            for data, items in chunks:
+                pending.append(data)
+                size += len(data)
+                count += items
+                if size >= chunk_bytes:
+                    out.write(_encoded(pending, encoding, errors))
+                    pending, size = [], 0
+            if pending:
+                out.write(_encoded(pending, encoding, errors))
+        finally:
+            if gzip:
+                out.close()
+    return count
+
+
+def _encoded(pending, encoding, errors):
+    data = pending[0][:0].join(pending)
+    return data.encode(encoding, errors) if isinstance(data, text_type) else data
+
+
+def _line_chunks(iterable):
+    for lines in _batches(iterable, _WRITE_BATCH_SIZE):
+        newline = b'\n' if isinstance(lines[0], bytes) else u'\n'
+        yield newline.join(lines) + newline, len(lines)
+
+
+def _joined_chunks(iterable):
+    for items in _batches(iterable, _WRITE_BATCH_SIZE):
+        yield items[0][:0].join(items), len(items)
+
+
+def _csv_chunks(header, rows, fmtparams):
+    buffer = NativeStringIO()
+    writer = csv.writer(buffer, **fmtparams)
+    if header is not None:
+        writer.writerow(header)
+        yield buffer.getvalue(), 0
+        buffer.seek(0)
+        buffer.truncate()
+    for batch in _batches(rows, _WRITE_BATCH_SIZE):
+        writer.writerows(batch)
+        yield buffer.getvalue(), len(batch)
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from pipetools import X, pipe, foreach
+from pipetools.aio import apipe, foreach_async, where_async
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def double(x):
+    await asyncio.sleep(0)
+    return x * 2
+
+
+async def numbers(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+
+class TestAsyncPipe:
+
+    def test_async_stages(self):
+        f = apipe | double | str | double
+
+        assert run(f(2)) == '44'
+
+    def test_input(self):
+        assert run(2 > apipe | double | X + 1) == 5
+
+    def test_empty(self):
+        assert run(2 > apipe) == 2
+
+    def test_single_sync_stage(self):
+        assert run((apipe | str)(3)) == '3'
+
+    def test_pipe_in_a_pipe(self):
+        f = pipe | int | apipe | double
+
+        assert run(f('21')) == 42
+
+    def test_repr(self):
+        f = apipe | double | str
+        assert repr(f) == 'double | str'
+
+
+class TestForeachAsync:
+
+    def test_basic(self):
+        f = apipe | foreach_async(double)
+
+        assert run(f([1, 2, 3])) == [2, 4, 6]
+
+    def test_async_iterable(self):
+        f = apipe | numbers | foreach_async(double, concurrency=2)
+
+        assert run(f(4)) == [0, 2, 4, 6]
+
+    def test_sync_function(self):
+        f = apipe | foreach_async({'x': X})
+
+        assert run(f([1])) == [{'x': 1}]
+
+    def test_concurrency_limit(self):
+        running = []
+
+        async def track(x):
+            running.append(x)
+            assert len(running) <= 2
+            await asyncio.sleep(0.01)
+            running.remove(x)
+            return x
+
+        f = apipe | foreach_async(track, concurrency=2)
+
+        assert run(f(range(6))) == [0, 1, 2, 3, 4, 5]
+
+    def test_followed_by_sync_util(self):
+        f = apipe | foreach_async(double) | foreach(X + 1) | list
+
+        assert run(f([1, 2])) == [3, 5]
+
+    def test_keyword_only_concurrency(self):
+        with pytest.raises(TypeError):
+            foreach_async(double, 3)
+        with pytest.raises(TypeError):
+            where_async(double, 3)
+
+    def test_repr(self):
+        f = foreach_async(double, concurrency=3)
+        assert repr(f) == 'foreach_async(double, concurrency=3)'
+
+
+class TestWhereAsync:
+
+    def test_basic(self):
+        async def even(x):
+            return x % 2 == 0
+
+        f = apipe | numbers | where_async(even, concurrency=3)
+
+        assert run(f(7)) == [0, 2, 4, 6]
+
+    def test_regex(self):
+        f = apipe | where_async('^a')
+
+        assert run(f(['ab', 'ba', None, 'aa'])) == ['ab', 'aa']
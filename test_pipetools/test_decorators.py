@@ -1,4 +1,5 @@
 from pipetools import foreach, sort_by, X, unless
+from pipetools.debug import LazyName
 from pipetools.compat import range
 
 
@@ -38,3 +39,10 @@ class TestPipeUtilsRepr:
 
         foreach(Something())
         unless(Exception, Something())
+
+    def test_name_is_made_lazily(self):
+        f = foreach(my_func, 42)
+        name = f.func.__pipetools__name__
+
+        assert isinstance(name, LazyName)
+        assert name() == 'foreach(my_func, 42)'
@@ -51,3 +51,35 @@ def test_no_builder():
 
     with pytest.raises(ValueError):
         DSBuilder('not a DS')
+
+
+def test_single_item_tuple():
+
+    f = DSBuilder((X + 1,))
+
+    assert f(1) == (2,)
+
+
+def test_mixed_items():
+
+    f = DSBuilder({'str': str, 'static': [1, None], 'name': 'n{0}', (X, 1): X.real})
+
+    assert f(3) == {'str': '3', 'static': [1, None], 'name': 'n3', (3, 1): 3}
+
+
+def test_long_x():
+
+    f = DSBuilder([X + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1 + 1])
+
+    assert f(0) == [20]
+
+
+def test_custom_builder():
+    from pipetools import ds_builder
+
+    ds_builder.builders[set] = lambda definition: lambda x: set((~d)(x) for d in definition)
+    try:
+        f = DSBuilder({'s': set([X + 1, X - 1])})
+        assert f(1) == {'s': set([0, 2])}
+    finally:
+        del ds_builder.builders[set]
@@ -1,7 +1,7 @@
 # encoding: utf-8
 import pytest
 
-from pipetools import pipe, X, maybe, xpartial
+from pipetools import pipe, X, maybe, xpartial, intern_pipes, foreach, where
 from pipetools.main import StringFormatter
 from pipetools.compat import range
 
@@ -45,6 +45,29 @@ class TestPipe(object):
         f = self.pipe | u'That will be £ {0}, please.'
         assert f(42) == u'That will be £ 42, please.'
 
+    def test_long_pipe(self):
+        f = self.pipe
+        for i in range(2000):
+            f = f | (X + 1)
+
+        assert f(0) == 2000
+
+    def test_flat_stages(self):
+        f = self.pipe | str | int | (X * 2)
+        assert len(type(f).stages(f.func)) == 3
+
+    def test_composed_pipes_used_separately(self):
+        f = self.pipe | foreach(X + 1)
+        g = f | where(X > 1) | list
+        assert g([0, 1, 2]) == [2, 3]
+        assert list(f([0])) == [1]
+        assert (f | list)([0]) == [1]
+        assert len(type(g).stages(g.func)) == 2
+
+    def test_repr(self):
+        f = self.pipe | str | X.upper()
+        assert repr(f) == '{0}{1}X.upper | X()'.format('str', f.separator)
+
     def test_makes_a_bound_method(self):
 
         class SomeClass(object):
@@ -254,6 +277,44 @@ class TestX:
         f = ~(X + (1, 2))
         assert repr(f) == "X + (1, 2)"
 
+    def test_chain(self):
+        f = ~(X.real['item'](2, x=3) * 2 - 1)
+
+        assert f(Bunch(real={'item': lambda a, x: a + x})) == 9
+
+    def test_compiled_once(self):
+        x = X.attr + 1
+        assert ~x is ~x
+
+    def test_same_shape_different_operands(self):
+        f = ~(X['a'] + 1)
+        g = ~(X['b'] + 2)
+
+        assert f({'a': 1, 'b': 1}) == 2
+        assert g({'a': 1, 'b': 1}) == 3
+
+    def test_unhashable_operands(self):
+        f = ~(X + [1])
+        assert f([0]) == [0, 1]
+
+    def test_getattr_not_an_identifier(self):
+        obj = Bunch()
+        setattr(obj, 'not an identifier', 1)
+        setattr(obj, 'class', 2)
+
+        assert (~getattr(X, 'not an identifier'))(obj) == 1
+        assert (~getattr(X, 'class'))(obj) == 2
+
+    def test_elementwise(self):
+        assert (~(-X * 2 > 3)).func.elementwise
+        assert not hasattr((~(X.real * 2)).func, 'elementwise')
+
+    def test_bind(self):
+        f = ~X['key'].bind('double', lambda x: x * 2)
+
+        assert f({'key': 21}) == 42
+        assert repr(f) == "X['key'] | double"
+
 
 class TestStringFormatter:
 
@@ -281,6 +342,10 @@ class TestStringFormatter:
         f = StringFormatter('Asdf {0}')
         assert f(u'Žluťoučký kůň') == u'Asdf Žluťoučký kůň'
 
+    def test_repr(self):
+        f = StringFormatter('{0} is a long template, longer than 20 characters')
+        assert repr(pipe | f) == "format('{0} is a long templa')"
+
     def test_unicode2(self):
         f = StringFormatter(u'Asdf {0}')
         assert f(u'Žluťoučký kůň') == u'Asdf Žluťoučký kůň'
@@ -318,6 +383,10 @@ class TestPipeInAPipe:
         with pytest.raises(TypeError):
             f(3)
 
+    def test_maybe_in_a_pipe_repr(self):
+        f = pipe | str | int | maybe | X.hello
+        assert repr(f) == 'str | int ?| X.hello'
+
     def test_pipe_in_a_pipe_because_why_not(self):
         f = pipe | str | pipe | int
         assert f(3) == 3
@@ -363,3 +432,101 @@ class TestXPartial:
 
         f = xpartial(my_callable(), (X + "!"))
         assert f("x") == "hello x!"
+
+    def test_call_kwargs_override(self):
+        xf = xpartial(dummy, X, kwarg=X + 1, other=0)
+        assert xf(1, other=2, foo=3) == ((1,), {'kwarg': 2, 'other': 2, 'foo': 3})
+
+    def test_non_identifier_kwargs(self):
+        xf = xpartial(dummy, **{'not valid': X, 'class': 1})
+        assert xf(1) == ((), {'not valid': 1, 'class': 1})
+
+    def test_binds_to_classes(self):
+        class Something(object):
+            method = xpartial(dummy, 1)
+
+        something = Something()
+        assert something.method(2) == ((1, something, 2), {})
+
+    def test_wraps(self):
+        xf = xpartial(dummy, X)
+        assert xf.__name__ == 'dummy'
+        assert xf.__wrapped__ is dummy
+
+
+class TestInterning:
+
+    def setup_method(self):
+        intern_pipes()
+
+    def teardown_method(self):
+        intern_pipes(0)
+
+    def make_pipe(self, n=1):
+        return pipe | where(X['a'] > n) | foreach((X['b'], '{c}')) | list
+
+    def test_same_pipe(self):
+        assert self.make_pipe() is self.make_pipe()
+
+    def test_same_utils(self):
+        assert where(X['a'] > 1) is where(X['a'] > 1)
+        assert foreach((X['b'], '{c}')) is foreach((X['b'], '{c}'))
+
+    def test_different_pipes(self):
+        f = self.make_pipe(1)
+        g = self.make_pipe(2)
+
+        assert f.func is not g.func
+        assert f([{'a': 2, 'b': 1, 'c': 0}]) == [(1, '0')]
+        assert g([{'a': 2, 'b': 1, 'c': 0}]) == []
+
+    def test_types_matter(self):
+        assert (~(X + 1))(1) == 2
+        assert isinstance((~(X + 1.0))(1), float)
+
+    def test_signed_zero(self):
+        assert (~(X * -0.0))(1) == -0.0
+        assert str((~(X * 0.0))(1)) == '0.0'
+        assert str((~(X * -0.0))(1)) == '-0.0'
+
+    def test_lists_by_identity(self):
+        a, b = [1], [1]
+        f, g = xpartial(dummy, a), xpartial(dummy, b)
+
+        assert f is not g
+        assert xpartial(dummy, a) is f
+        a.append(2)
+        assert g() == (([1],), {})
+
+    def test_dicts_by_identity(self):
+        assert foreach({'b': X['b']}) is not foreach({'b': X['b']})
+
+    def test_x(self):
+        assert ~X.attr[1] is ~X.attr[1]
+
+    def test_xpartial(self):
+        assert xpartial(dummy, X, 1) is xpartial(dummy, X, 1)
+
+    def test_keyword_arguments(self):
+        assert xpartial(int, base=X) is xpartial(int, base=X)
+        assert foreach(sorted, key=len) is foreach(sorted, key=len)
+        assert foreach(sorted, key=len) is not foreach(sorted, key=abs)
+        assert xpartial(dummy, a=1) is not xpartial(dummy, a=1.0)
+
+    def test_unhashable(self):
+        f = pipe | foreach(X + [1]) | list
+        g = pipe | foreach(X + [1]) | list
+
+        assert f([[0]]) == g([[0]]) == [[0, 1]]
+
+    def test_size_limit(self):
+        intern_pipes(2)
+        f = foreach(str)
+        foreach(int)
+        foreach(float)
+
+        assert foreach(str) is not f
+
+    def test_disabled(self):
+        intern_pipes(0)
+        assert self.make_pipe() is not self.make_pipe()
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from pipetools import pipe, maybe, foreach, where, X, profile
+
+
+def slow(x):
+    time.sleep(0.01)
+    return x
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+class TestProfile:
+
+    def test_calls(self):
+        f = pipe | str | int | (X + 1)
+
+        with profile() as stats:
+            f(1)
+            f(2)
+
+        assert stats.as_dict()['str'] == {
+            'calls': 2,
+            'cumulative': stats.stats['str'][1],
+            'self': stats.stats['str'][2],
+            'exceptions': 0,
+        }
+        assert list(stats.as_dict()) == ['str', 'int', 'X + 1']
+
+    def test_lazy_stages(self):
+        f = pipe | foreach(slow) | where(X > 0) | list
+
+        with profile() as stats:
+            assert f([0, 1, 2]) == [1, 2]
+
+        result = stats.as_dict()
+        assert result['foreach(slow)']['calls'] == 1
+        assert result['foreach(slow)']['self'] >= 0.03
+        assert result['where(X > 0)']['self'] < 0.01
+        assert result['list']['cumulative'] >= 0.03
+        assert result['list']['self'] < 0.01
+
+    def test_nested_pipes(self):
+        f = pipe | foreach(pipe | slow | str) | list
+
+        with profile() as stats:
+            f([1, 2])
+
+        result = stats.as_dict()
+        assert result['slow']['calls'] == 2
+        assert result['foreach(slow | str)']['cumulative'] >= 0.02
+        assert result['foreach(slow | str)']['self'] < 0.01
+
+    def test_single_stage(self):
+        with profile() as stats:
+            assert (5 > pipe | slow) == 5
+            assert ([1, 2] > foreach(slow) | list) == [1, 2]
+            assert (maybe | slow)(3) == 3
+            assert (None > maybe | slow) is None
+
+        result = stats.as_dict()
+        assert result['slow']['calls'] == 2
+        assert result['foreach(slow)']['calls'] == 1
+        assert result['foreach(slow)']['cumulative'] >= 0.02
+
+    def test_exceptions(self):
+        f = maybe | fail | str
+
+        with profile() as stats:
+            with pytest.raises(ValueError):
+                f(1)
+
+        assert stats.as_dict() == {'fail': {
+            'calls': 1,
+            'cumulative': stats.stats['fail'][1],
+            'self': stats.stats['fail'][2],
+            'exceptions': 1,
+        }}
+
+    def test_not_profiling(self):
+        f = pipe | str | int
+
+        with profile() as stats:
+            pass
+        f(1)
+
+        assert stats.as_dict() == {}
+
+    def test_table(self):
+        with profile() as stats:
+            (pipe | slow | str)(1)
+
+        lines = str(stats).splitlines()
+        assert lines[0].split() == ['calls', 'cumulative', 'self', 'exceptions', 'stage']
+        assert lines[1].split()[0] == '1'
+        assert lines[1].split()[-1] == 'slow'
+        assert len(lines) == 3
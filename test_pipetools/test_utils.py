@@ -1,5 +1,18 @@
-from pipetools import X, sort_by, take_first, foreach, where, select_first, group_by
+import gzip
+import re
+import time
+
+import pytest
+
+from pipetools import pipe, maybe, X, sort_by, take_first, foreach, where, select_first, group_by
+from pipetools import first_of
 from pipetools import unless, flatten, take_until, as_kwargs, drop_first, tee
+from pipetools import where_not
+from pipetools import foreach_parallel, cached, slice_items, regex_matcher
+from pipetools import batch, batch_by, foreach_batch
+from pipetools import count, total, minimum, maximum, minmax, mean_var, histogram, reduce_all
+from pipetools import broadcast, fanout, read_lines, read_records
+from pipetools import write_lines, to_file, to_csv
 from pipetools.compat import range
 
 
@@ -40,6 +53,256 @@ class TestSortBy:
             ('w', 1),
         ]
 
+    def test_top_and_bottom(self):
+        items = [(i % 4, i) for i in range(20)]
+        key = lambda item: item[0]
+
+        assert (items > sort_by(X[0]).top(5)) == sorted(items, key=key)[:5]
+        assert (items > sort_by(X[0]).bottom(5)) == sorted(items, key=key)[-5:]
+        assert (items > sort_by(X[0]).descending.top(5)) == sorted(items, key=key, reverse=True)[:5]
+        assert (items > sort_by(X[0]).descending.bottom(5)) == sorted(items, key=key, reverse=True)[-5:]
+
+    def test_external(self, tmpdir):
+        items = [(i * 7 % 10, i) for i in range(100)]
+
+        result = items > sort_by(X[0]).external(max_items_in_memory=30, tmpdir=str(tmpdir))
+
+        assert next(result) == (0, 0)
+        assert list(result) == sorted(items, key=lambda item: item[0])[1:]
+
+    @pytest.mark.parametrize('size', [1, 30, 90, 100, 271, 1000])
+    def test_external_limits_open_files(self, monkeypatch, size):
+        import pipetools.utils
+        monkeypatch.setattr(pipetools.utils, '_MAX_MERGED_RUNS', 3)
+        spill, spilled, most_open = pipetools.utils._spill, [], [0]
+
+        def counted_spill(items, tmpdir):
+            f = spill(items, tmpdir)
+            spilled.append(f)
+            most_open[0] = max(most_open[0], sum(not f.closed for f in spilled))
+            return f
+        monkeypatch.setattr(pipetools.utils, '_spill', counted_spill)
+        items = [(i * 7 % 10, i) for i in range(size)]
+
+        result = items > sort_by(X[0]).external(max_items_in_memory=10) | list
+
+        assert result == sorted(items, key=lambda item: item[0])
+        # up to 2 not yet merged runs per level (of runs merged from 3 ** level)
+        levels = 1 + len([n for n in range(1, 10) if 3 ** n <= (size + 9) // 10])
+        assert most_open[0] <= 2 * levels + 1
+        assert all(f.closed for f in spilled)
+
+    def test_external_descending(self):
+        items = [(i * 7 % 10, i) for i in range(100)]
+
+        result = items > sort_by(X[0]).descending.external(max_items_in_memory=7) | list
+
+        assert result == sorted(items, key=lambda item: item[0], reverse=True)
+
+    @pytest.mark.parametrize('reverse', [False, True])
+    def test_decorated_merge(self, reverse):
+        # what external sorting merges with on Python 2
+        from pipetools.compat import decorated_merge
+        runs = [sorted([(i * 7 % 5, i) for i in range(start, 30, 3)],
+                       key=lambda item: item[0], reverse=reverse)
+                for start in range(3)]
+        expected = sorted(sum(runs, []), key=lambda item: item[0], reverse=reverse)
+
+        assert list(decorated_merge(*runs, key=lambda item: item[0], reverse=reverse)) == expected
+
+    def test_external_empty(self):
+        assert ([] > sort_by(X).external() | list) == []
+
+    @pytest.mark.parametrize('size', [0, -1, 1.5, None])
+    def test_external_invalid_size(self, size):
+        with pytest.raises(ValueError):
+            sort_by(X).external(max_items_in_memory=size)
+
+    def test_external_repr(self):
+        assert (repr(sort_by(X).external(max_items_in_memory=10))
+            == 'sort_by(X).external(max_items_in_memory=10, tmpdir=None)')
+
+    def test_top_repr(self):
+        assert repr(sort_by(X.score).descending.top(3)) == 'sort_by(X.score).descending.top(3)'
+
+    def test_fused_with_take_first(self):
+        f = pipe | sort_by(-X) | take_first(3)
+        result = f([5, 1, 7, 3])
+
+        assert next(result) == 7
+        assert list(result) == [5, 3]
+        assert repr(f) == 'sort_by(-X) | take_first(3)'
+
+    def test_fused_descending_in_maybe(self):
+        f = maybe | sort_by(X).descending | take_first(2) | list
+
+        assert f([5, 1, 7, 3]) == [7, 5]
+        assert f(None) is None
+
+
+class TestForeachParallel:
+
+    def test_threads(self):
+        result = range(10) > foreach(X * 2).parallel(workers=3) | list
+        assert result == [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+
+    def test_unordered(self):
+        f = foreach(X * 2).parallel(workers=3, chunksize=2, ordered=False)
+        assert (range(10) > f | sorted) == [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+
+    def test_processes(self):
+        f = foreach_parallel(abs, workers=2, mode='process', chunksize=10)
+        assert (range(-50, 0) > f | list) == list(range(50, 0, -1))
+
+    def test_lazy(self):
+        def numbers():
+            consumed.append(True)
+            yield 1
+
+        consumed = []
+        numbers() > foreach(X).parallel(workers=2)
+        assert consumed == []
+
+    def test_infinite_input(self):
+        f = foreach(X + 1).parallel(workers=2) | take_first(3) | list
+        assert f(iter(int, 1)) == [1, 1, 1]
+
+    def test_ds_builder(self):
+        f = foreach_parallel((X, X * 2), workers=2) | list
+        assert f([1, 2]) == [(1, 2), (2, 4)]
+
+    def test_exception(self):
+        f = foreach(X['key']).parallel(workers=2) | list
+        with pytest.raises(KeyError):
+            f([{}])
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            foreach_parallel(X, mode='fibers')
+
+    def test_keyword_only_options(self):
+        with pytest.raises(TypeError):
+            foreach_parallel(abs, 2)
+        with pytest.raises(TypeError):
+            foreach_parallel(abs, worker=2)
+
+    @pytest.mark.parametrize('kwargs', [{'chunksize': 0}, {'workers': 0}, {'chunksize': 2.0}])
+    def test_invalid_sizes(self, kwargs):
+        with pytest.raises(ValueError):
+            foreach(X).parallel(**kwargs)
+
+
+class TestCached:
+
+    def test_cached(self):
+        calls = []
+        f = cached(lambda x: calls.append(x) or x * 2)
+
+        assert ([1, 2, 1, 1] > foreach(f) | list) == [2, 4, 2, 2]
+        assert calls == [1, 2]
+        assert f.cache_info() == (2, 2, 0, 128, 2)
+
+    def test_lru_eviction(self):
+        f = cached(X * 2, maxsize=2)
+        [1, 2, 1, 3, 2] > foreach(f) | list
+
+        info = f.cache_info()
+        assert (info.hits, info.misses, info.evictions, info.currsize) == (1, 4, 2, 2)
+
+    def test_ttl(self):
+        f = cached(X * 2, ttl=0.01)
+        f(1)
+        f(1)
+        time.sleep(0.02)
+        f(1)
+
+        assert f.cache_info()[:3] == (1, 2, 1)
+
+    def test_x_key(self):
+        f = cached(X['value'], key=X['id'])
+
+        assert f({'id': 1, 'value': 'a'}) == 'a'
+        assert f({'id': 1, 'value': 'b'}) == 'a'
+
+    def test_ds_key(self):
+        f = cached(X['value'], key=(X['a'], X['b']))
+
+        assert f({'a': 1, 'b': 2, 'value': 'x'}) == 'x'
+        assert f({'a': 1, 'b': 2, 'value': 'y'}) == 'x'
+        assert f({'a': 1, 'b': 3, 'value': 'z'}) == 'z'
+
+    @pytest.mark.parametrize('key', [
+        [X['a'], X['b']],
+        {'a': X['a'], 'b': [X['b']]},
+    ])
+    def test_list_and_dict_keys(self, key):
+        f = cached(X['value'], key=key)
+
+        assert f({'a': 1, 'b': 2, 'value': 'x'}) == 'x'
+        assert f({'a': 1, 'b': 2, 'value': 'y'}) == 'x'
+        assert f({'a': 1, 'b': 3, 'value': 'z'}) == 'z'
+        assert f.cache_info().currsize == 2
+
+    def test_zero_ttl(self):
+        f = cached(X * 2, ttl=0)
+        f(1)
+        f(1)
+
+        assert f.cache_info()[:2] == (0, 2)
+        assert repr(f) == 'cached(X * 2, maxsize=128, ttl=0)'
+
+    def test_unhashable(self):
+        f = cached(len)
+
+        assert f([1, 2]) == 2
+        assert f.cache_info().currsize == 0
+
+    def test_cache_clear(self):
+        f = cached(X)
+        f(1)
+        f.cache_clear()
+
+        assert f.cache_info() == (0, 0, 0, 128, 0)
+
+    def test_repr(self):
+        f = cached(X * 2, maxsize=10, key=X.id)
+        assert repr(f) == 'cached(X * 2, maxsize=10, key=X.id)'
+
+
+class TestNumpyArrays:
+
+    numpy = property(lambda self: pytest.importorskip('numpy'))
+
+    def test_foreach(self):
+        result = self.numpy.arange(5) > foreach(X * 2 + 1)
+
+        assert isinstance(result, self.numpy.ndarray)
+        assert result.tolist() == [1, 3, 5, 7, 9]
+
+    def test_foreach_not_elementwise(self):
+        result = self.numpy.arange(3) > foreach(X.item()) | list
+
+        assert result == [0, 1, 2]
+
+    def test_where(self):
+        result = self.numpy.arange(10) > where(X % 3 == 0)
+
+        assert result.tolist() == [0, 3, 6, 9]
+
+    def test_where_not(self):
+        result = self.numpy.arange(10) > where_not(X % 3)
+
+        assert result.tolist() == [0, 3, 6, 9]
+
+    def test_where_2d(self):
+        rows = self.numpy.arange(6).reshape(3, 2)
+        result = rows > where(X.sum() > 2) | foreach(X.tolist()) | list
+
+        assert result == [[2, 3], [4, 5]]
+
+    def test_elementwise_on_lists(self):
+        assert ([1, 2, 3] > where_not(X > 1) | foreach(-X) | list) == [-1]
+
 
 class TestTakeFirst:
 
@@ -81,6 +344,16 @@ class TestSelectFirst:
     def test_select_first_empty(self):
         assert select_first(X)([]) is None
 
+    def test_select_first_function(self):
+        assert select_first(lambda x: x > 1)(iter([1, 2, 3])) == 2
+
+    def test_select_first_regex(self):
+        assert (['py', 'pie', 'pi'] > select_first('^pi')) == 'pie'
+
+    def test_first_of(self):
+        assert first_of(['', None, 0, 3, 'something']) == 3
+        assert first_of([]) is None
+
 
 class TestAutoStringFormatter:
 
@@ -119,6 +392,36 @@ class TestUnless:
         f = unless(TypeError, X * 'x')
         assert f('x') is None
 
+    def test_exception_tuple(self):
+        f = unless((KeyError, IndexError), X[0])
+        assert f([]) is None
+        assert f({}) is None
+
+    def test_exception_not_caught(self):
+        f = unless(KeyError, X[0])
+        with pytest.raises(IndexError):
+            f([])
+
+    def test_more_arguments(self):
+        f = unless(ZeroDivisionError, lambda a, b: a / b)
+        assert f(6, 3) == 2
+        assert f(1, 0) is None
+
+    def test_keyword_arguments(self):
+        f = unless(ZeroDivisionError, lambda a, b=1: a / b)
+        assert f(6, b=3) == 2
+        assert f(a=1, b=0) is None
+
+    def test_no_arguments(self):
+        assert unless(KeyError, dict)() == {}
+        assert unless(KeyError, lambda: {}['x'])() is None
+
+    def test_wrong_arguments_caught(self):
+        assert unless(TypeError, lambda a: a)(1, 2) is None
+
+    def test_repr(self):
+        assert repr(unless(IndexError, X[0])) == "unless(<class 'IndexError'>, X[0])"
+
 
 class TestFlatten:
 
@@ -134,6 +437,23 @@ class TestFlatten:
         assert (list(flatten([[{'a': 1}], {'b': 2}, 'c'], {'d': 3}))
             == [{'a': 1}, {'b': 2}, 'c', {'d': 3}])
 
+    def test_flatten_deep(self):
+        nested = 42
+        for _ in range(10000):
+            nested = [nested]
+        assert list(flatten(nested, [1])) == [42, 1]
+
+    def test_flatten_depth(self):
+        f = flatten(depth=1) | list
+        assert f([[1, [2]], (3, 4), 'five']) == [1, [2], 3, 4, 'five']
+        assert repr(f) == 'flatten(depth=1) | list'
+
+    def test_flatten_depth_zero(self):
+        assert ([[1], 2] > flatten(depth=0) | list) == [[1], 2]
+
+    def test_flatten_depth_args(self):
+        assert list(flatten([[1, [2]]], 3, depth=1)) == [1, [2], 3]
+
 
 class TestTakeUntil:
 
@@ -190,6 +510,43 @@ class TestRegexCondidion:
             'foolproof',
         ]
 
+    def test_bytes(self):
+        data = [b'foo', b'bar']
+        assert (data > where(b'^b') | list) == [b'bar']
+
+    def test_compiled_pattern(self):
+        data = ['Foo', 'bar']
+        assert (data > where(re.compile('^f', re.I)) | list) == ['Foo']
+
+    def test_search(self):
+        data = ['foo bar', 'boo far', 'foolproof']
+        f = where(regex_matcher('oo f', 'search')) | list
+        assert f(data) == ['boo far']
+
+    def test_fullmatch(self):
+        data = ['foo', 'foo bar']
+        f = where(regex_matcher('foo', 'fullmatch')) | list
+        assert f(data) == ['foo']
+
+    @pytest.mark.parametrize('pattern', [
+        r'^ERROR', r'ERROR$', r'^$', r'\d{3}$', r'^(?!INFO)\w+', r'x\Z',
+        r'\bfoo', r'o\B', r'(?s)foo.*bar',
+    ])
+    def test_bulk_same_as_one_by_one(self, pattern):
+        words = ['ERROR', 'INFO', 'foo', 'bar', '', '123', 'x', 'ERROR x\n']
+        data = [
+            ' '.join(words[(i * 7 + j) % len(words)] for j in range(i % 4))
+            for i in range(5000)
+        ]
+        expected = [item for item in data if re.match(pattern, item)]
+
+        assert (data > where(pattern) | list) == expected
+        assert (iter(data) > where(pattern) | list) == expected
+
+    def test_bulk_with_none(self):
+        data = ['foo'] * 1500 + [None, 'bar', 'foolproof']
+        assert (data > where('^foo') | list) == ['foo'] * 1500 + ['foolproof']
+
 
 class TestGroupBy:
 
@@ -197,6 +554,34 @@ class TestGroupBy:
         src = [1, 2, 3, 4, 5, 6]
         assert (src > group_by(X % 2) | dict) == {0: [2, 4, 6], 1: [1, 3, 5]}
 
+    def test_sorted(self):
+        src = iter([1, 3, 2, 4, 6, 5])
+        result = src > group_by(X % 2).sorted
+
+        assert next(result) == (1, [1, 3])
+        assert list(result) == [(0, [2, 4, 6]), (1, [5])]
+
+    def test_aggregate(self):
+        src = [1, 2, 3, 4, 5, 6]
+        f = group_by(X % 2).aggregate(lambda a, b: a + b)
+
+        assert (src > f | dict) == {0: 12, 1: 9}
+
+    def test_aggregate_initial(self):
+        src = ['a', 'bb', 'c']
+        f = group_by(len).aggregate(lambda n, item: n + 1, 0)
+
+        assert (src > f | dict) == {1: 2, 2: 1}
+
+    def test_sorted_aggregate(self):
+        src = [1, 3, 2, 4, 5]
+        f = group_by(X % 2).sorted.aggregate(lambda n, item: n + 1, 0)
+
+        assert (src > f | list) == [(1, 2), (0, 2), (1, 1)]
+
+    def test_repr(self):
+        assert repr(group_by(X.id).aggregate(max)) == 'group_by(X.id).aggregate(max)'
+
 
 class TestDropFirst:
 
@@ -207,6 +592,82 @@ class TestDropFirst:
     def test_iterable(self):
         assert (range(10000) > drop_first(9999) | list) == [9999]
 
+    def test_generator(self):
+        assert ((x for x in range(5)) > drop_first(3) | list) == [3, 4]
+
+    def test_more_than_available(self):
+        assert ([1, 2] > drop_first(5) | list) == []
+
+    @pytest.mark.parametrize('src', [[1, 2, 3, 4], iter([1, 2, 3, 4])])
+    def test_drop_first_negative(self, src):
+        assert (src > drop_first(-1) | list) == [1, 2, 3, 4]
+
+    def test_returns_iterator(self):
+        result = [1, 2, 3] > drop_first(1)
+        assert next(result) == 2
+
+
+class TestBatch:
+
+    def test_batch(self):
+        assert (range(7) > batch(3) | list) == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_empty(self):
+        assert ([] > batch(3) | list) == []
+
+    def test_lazy(self):
+        f = batch(2) | take_first(2) | list
+        assert f(iter(int, 1)) == [[0, 0], [0, 0]]
+
+    def test_batch_by(self):
+        src = ['a', 'bcd', 'ef', 'g', 'hijkl', 'm']
+        result = src > batch_by(len, 4) | list
+        assert result == [['a', 'bcd'], ['ef', 'g'], ['hijkl'], ['m']]
+
+    def test_batch_by_x(self):
+        src = [{'size': 2}, {'size': 2}, {'size': 1}]
+        result = src > batch_by(X['size'], 3) | foreach(len) | list
+        assert result == [1, 2]
+
+    def test_foreach_batch(self):
+        calls = []
+
+        def double_all(items):
+            calls.append(len(items))
+            return [item * 2 for item in items]
+
+        assert (range(5) > foreach_batch(double_all, 2) | list) == [0, 2, 4, 6, 8]
+        assert calls == [2, 2, 1]
+
+    @pytest.mark.parametrize('size', [0, -2, '3'])
+    def test_invalid_size(self, size):
+        with pytest.raises(ValueError):
+            batch(size)
+        with pytest.raises(ValueError):
+            foreach_batch(sum, size)
+
+    def test_repr(self):
+        assert repr(foreach_batch(sum, 10)) == 'foreach_batch(sum, 10)'
+        assert repr(batch_by(X.size, 10)) == 'batch_by(X.size, 10)'
+
+
+class TestSliceItems:
+
+    def test_list(self):
+        assert ([0, 1, 2, 3, 4, 5] > slice_items(1, 5, 2) | list) == [1, 3]
+
+    def test_iterator(self):
+        assert (iter(range(10)) > slice_items(2, 8, 3) | list) == [2, 5]
+
+    def test_start_only(self):
+        assert ('abcd' > slice_items(2) | list) == ['c', 'd']
+
+    def test_negative_on_sequence(self):
+        assert ((1, 2, 3, 4) > slice_items(-2, None) | list) == [3, 4]
+
+    def test_repr(self):
+        assert repr(slice_items(1, 5)) == 'slice_items(1, 5, None)'
+
 
 class TestTee:
 
@@ -217,3 +678,355 @@ class TestTee:
 
         assert store == ["tupni"]
         assert result == "put"
+
+
+class TestReducers:
+
+    def test_count(self):
+        assert (iter('abc') > count) == 3
+        assert count([1, 2]) == 2
+
+    def test_reducers(self):
+        assert ([] > total()) == 0
+        assert (['a', 'bb'] > total(len, start=1)) == 4
+        assert ([3, 1, 4, 1, 5] > minimum(-X)) == -5
+        assert ([3, 1, 4, 1, 5] > maximum(-X)) == -1
+        assert ([3, 1, 4, 1, 5] > minmax((X % 2, X))) == ((0, 4), (1, 5))
+        assert ('abcab' > histogram()) == {'a': 2, 'b': 2, 'c': 1}
+
+    def test_mean_var(self):
+        assert ([2, 4, 4, 4, 5, 5, 7, 9] > mean_var(X * 2)) == (10.0, 16.0)
+        assert ([1, 2, 3] > mean_var(ddof=1)) == (2.0, 1.0)
+
+    def test_empty(self):
+        for reducer in minimum(), maximum(), minmax(), mean_var():
+            with pytest.raises(ValueError):
+                [] > reducer
+
+    def test_reduce_all(self):
+        items = ({'size': size} for size in [3, 1, 2])
+
+        result = items > reduce_all({
+            'n': count,
+            'sizes': (minmax(X['size']), total(X['size'])),
+            'static': 'value',
+        })
+
+        assert result == {'n': 3, 'sizes': ((1, 3), 6), 'static': 'value'}
+
+    def test_reduce_all_single(self):
+        assert (range(5) > reduce_all(count)) == 5
+        assert (range(5) > reduce_all(total(X * 2))) == 20
+
+    @pytest.mark.parametrize('definition', [
+        {'m': max},
+        {'evens': where(X % 2 == 0) | count},
+        {'x': X},
+        [count, X * 2],
+    ])
+    def test_reduce_all_not_reducers(self, definition):
+        with pytest.raises(TypeError):
+            reduce_all(definition)
+
+    def test_reduce_all_in_pipe(self):
+        f = pipe | where(X % 2) | reduce_all([count, mean_var()])
+        assert f(range(10)) == [5, (5.0, 8.0)]
+
+    def test_repr(self):
+        assert repr(reduce_all([count, total(X.size)])) == 'reduce_all([count, total(X.size)])'
+        assert repr(mean_var(ddof=1)) == 'mean_var(X, ddof=1)'
+
+
+class TestLazyFusion:
+
+    def test_fused(self):
+        from pipetools.main import Pipe
+
+        f = pipe | where(X % 3) | foreach(X * 2) | where_not(X > 20) | foreach('{0}!') | list
+
+        assert f(range(15)) == ['2!', '4!', '8!', '10!', '14!', '16!', '20!']
+        assert len(Pipe.stages(f)) == 2
+        assert repr(f) == "where(X % 3) | foreach(X * 2) | where_not(X > 20) | foreach('{0}!') | list"
+
+    @pytest.mark.parametrize('f', [
+        pipe | foreach(X + 1) | where(X > 1),
+        pipe | take_first(2) | foreach(X + 1),
+    ])
+    def test_not_iterable_input(self, f):
+        with pytest.raises(TypeError):
+            f(5)
+
+    def test_take_first_is_lazy(self):
+        pulled = []
+
+        def source():
+            for i in range(10):
+                pulled.append(i)
+                yield i
+
+        f = pipe | foreach(X + 1) | take_first(3) | foreach(X * 2) | take_until(X > 100) | list
+
+        assert f(source()) == [2, 4, 6]
+        assert pulled == [0, 1, 2]
+
+    def test_take_first_after_filter(self):
+        pulled = []
+
+        def source():
+            for i in range(10):
+                pulled.append(i)
+                yield i
+
+        f = pipe | where(X % 2) | take_first(2) | foreach(X * 2) | list
+
+        assert f(source()) == [2, 6]
+        assert pulled == [0, 1, 2, 3]
+
+    def test_take_first_after_filter_and_take_first(self):
+        f = pipe | take_first(10) | where(X % 3 == 0) | take_first(2) | list
+        assert f(range(20)) == [0, 3]
+
+        f = pipe | foreach(X) | take_first(10) | where(X % 3 == 0) | take_first(2) | list
+        assert f(range(20)) == [0, 3]
+
+    def test_take_until(self):
+        f = pipe | foreach(X * 2) | take_until(X > 5) | where(X) | list
+
+        assert f([0, 1, 2, 3, 0]) == [2, 4]
+
+    def test_regex_where(self):
+        f = pipe | where(r'^a') | foreach(X.upper()) | list
+
+        assert f(['ab', 'ba', 'ac']) == ['AB', 'AC']
+        assert f(iter(['ab', 'ba'])) == ['AB']
+
+
+class TestBroadcast:
+
+    def test_single_pass(self):
+        items = (i for i in range(10000))
+
+        result = items > broadcast(count, where(X % 2) | count, foreach(X * 2) | max)
+
+        assert result == (10000, 5000, 19998)
+
+    def test_functions_stopping_early(self):
+        f = broadcast(take_first(2) | list, sum, take_first(1) | list, buffer_size=10)
+
+        assert f(iter(range(1000))) == ([0, 1], 499500, [0])
+
+    def test_fanout(self):
+        f = fanout({'n': count, 'evens': where_not(X % 2) | list})
+
+        assert f(iter(range(5))) == {'n': 5, 'evens': [0, 2, 4]}
+
+    def test_lazy_results(self):
+        first, second = range(5) > broadcast(foreach(X * 2), foreach(X + 1))
+        assert first == [0, 2, 4, 6, 8]
+        assert second == [1, 2, 3, 4, 5]
+
+    def test_lazy_result_of_consumer(self):
+        total, incremented = range(5) > broadcast(sum, foreach(X + 1))
+        assert total == 10
+        assert list(incremented) == [1, 2, 3, 4, 5]
+
+    def test_error(self):
+        f = broadcast(count, foreach(1 / X) | list)
+
+        with pytest.raises(ZeroDivisionError):
+            f(range(-5, 5))
+
+    def test_error_in_input(self):
+        def items():
+            yield 1
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            items() > broadcast(count, list)
+
+    def test_no_functions(self):
+        with pytest.raises(TypeError):
+            broadcast()
+
+    @pytest.mark.parametrize('size', [0, -1])
+    def test_invalid_buffer_size(self, size):
+        with pytest.raises(ValueError):
+            broadcast(count, buffer_size=size)
+        with pytest.raises(ValueError):
+            fanout({'n': count}, buffer_size=size)
+
+    def test_repr(self):
+        assert repr(broadcast(count, foreach(len) | max)) == 'broadcast(count, foreach(len) | max)'
+        assert repr(fanout({'n': count})) == "fanout({'n': count})"
+
+
+class TestReadLines:
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        path = tmpdir.join('lines.txt')
+        path.write_binary(u'first\r\nsecond \u00e9\n\nlast'.encode('utf-8'))
+        return str(path)
+
+    @pytest.mark.parametrize('mmap', [True, False])
+    @pytest.mark.parametrize('chunk_bytes', [1, 4, 1 << 20])
+    def test_lines(self, path, mmap, chunk_bytes):
+        lines = read_lines(path, encoding='utf-8', mmap=mmap, chunk_bytes=chunk_bytes)
+        assert list(lines) == [u'first', u'second \u00e9', u'', u'last']
+
+    def test_reiterable(self, path):
+        lines = read_lines(path, encoding='utf-8')
+        assert list(lines) == list(lines)
+
+    def test_pipe(self, path):
+        assert (path > read_lines | count) == 4
+
+    def test_utf16(self, tmpdir):
+        path = tmpdir.join('lines.txt')
+        path.write_binary(u'a\nb\n'.encode('utf-16'))
+        assert list(read_lines(str(path), encoding='utf-16')) == [u'a', u'b']
+
+    def test_empty(self, tmpdir):
+        path = tmpdir.join('empty.txt')
+        path.write_binary(b'')
+        assert list(read_lines(str(path))) == []
+
+    @pytest.mark.parametrize('chunk_bytes', [10, 1 << 20])
+    def test_regex_where(self, tmpdir, chunk_bytes):
+        path = tmpdir.join('log.txt')
+        path.write_binary(b''.join(
+            b'%d %s\n' % (i, b'ERROR' if i % 100 == 7 else b'ok') for i in range(1000)))
+        lines = read_lines(str(path), encoding='ascii', chunk_bytes=chunk_bytes)
+        result = lines > where(r'\d+ ERROR$') | list
+        assert result == [u'%d ERROR' % i for i in range(7, 1000, 100)]
+
+    @pytest.mark.parametrize('method, expected', [
+        ('match', [u'ERROR one', u'ERROR']),
+        ('search', [u'ERROR one', u'two ERROR', u'three ERROR x', u'ERROR']),
+        ('fullmatch', [u'ERROR']),
+    ])
+    @pytest.mark.parametrize('chunk_bytes', [5, 1 << 20])
+    def test_regex_methods(self, tmpdir, method, expected, chunk_bytes):
+        path = tmpdir.join('log.txt')
+        lines = [u'ERROR one', u'ok', u'two ERROR', u'three ERROR x', u'', u'ERROR']
+        path.write_binary(u'\n'.join(lines).encode('ascii'))
+        condition = where(regex_matcher('ERROR', method))
+
+        result = read_lines(str(path), encoding='ascii', chunk_bytes=chunk_bytes) > condition | list
+
+        assert result == expected
+        assert (lines > condition | list) == expected
+
+
+class TestReadRecords:
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        path = tmpdir.join('records.bin')
+        path.write_binary(b'one\0two\0\0three\0')
+        return str(path)
+
+    @pytest.mark.parametrize('mmap', [True, False])
+    @pytest.mark.parametrize('chunk_bytes', [1, 5, 1 << 20])
+    def test_records(self, path, mmap, chunk_bytes):
+        records = read_records(path, sep=b'\0', mmap=mmap, chunk_bytes=chunk_bytes)
+        assert list(records) == [b'one', b'two', b'', b'three']
+
+    def test_views(self, path):
+        records = read_records(path, sep=b'\0', views=True, chunk_bytes=5)
+        assert [r.tobytes() for r in records] == [b'one', b'two', b'', b'three']
+
+    def test_multibyte_separator(self, tmpdir):
+        path = tmpdir.join('records.bin')
+        path.write_binary(b'a--b--c')
+        assert list(read_records(str(path), sep=b'--', chunk_bytes=2)) == [b'a', b'b', b'c']
+
+    def test_regex_where(self, path):
+        result = read_records(path, sep=b'\0') > where(re.compile(b't')) | list
+        assert result == [b'two', b'three']
+
+
+class TestWriteLines:
+
+    @pytest.mark.parametrize('chunk_bytes', [1, 10, 1 << 20])
+    def test_text(self, tmpdir, chunk_bytes):
+        path = str(tmpdir.join('out.txt'))
+        lines = [u'line %d \u00e9' % i for i in range(2500)]
+
+        assert (lines > write_lines(path, encoding='utf-8', chunk_bytes=chunk_bytes)) == 2500
+        assert list(read_lines(path, encoding='utf-8')) == lines
+
+    def test_bytes(self, tmpdir):
+        path = tmpdir.join('out.bin')
+        assert ([b'a', b'b'] > write_lines(str(path))) == 2
+        assert path.read_binary() == b'a\nb\n'
+
+    def test_empty(self, tmpdir):
+        path = tmpdir.join('out.txt')
+        assert ([] > write_lines(str(path))) == 0
+        assert path.read_binary() == b''
+
+    def test_append(self, tmpdir):
+        path = tmpdir.join('out.txt')
+        ['a'] > write_lines(str(path))
+        ['b'] > write_lines(str(path), append=True)
+        assert path.read_binary() == b'a\nb\n'
+
+    def test_gzip(self, tmpdir):
+        path = str(tmpdir.join('out.txt.gz'))
+        assert (range(3) > foreach(str) | write_lines(path)) == 3
+        with gzip.open(path, 'rb') as f:
+            assert f.read() == b'0\n1\n2\n'
+
+    def test_gzip_path_object(self, tmp_path):
+        path = tmp_path / 'out.txt.gz'
+        assert (['a', 'b'] > write_lines(path)) == 2
+        with gzip.open(str(path), 'rb') as f:
+            assert f.read() == b'a\nb\n'
+
+    def test_repr(self):
+        assert repr(write_lines('out.txt')) == "write_lines('out.txt')"
+
+
+class TestToFile:
+
+    def test_to_file(self, tmpdir):
+        path = tmpdir.join('out.bin')
+        assert ([b'ab', b'', b'c'] > to_file(str(path), chunk_bytes=2)) == 3
+        assert path.read_binary() == b'abc'
+
+    def test_gzip(self, tmpdir):
+        path = str(tmpdir.join('out'))
+        [u'x', u'y'] > to_file(path, gzip=True)
+        with gzip.open(path, 'rb') as f:
+            assert f.read() == b'xy'
+
+
+class TestToCsv:
+
+    def test_to_csv(self, tmpdir):
+        path = tmpdir.join('out.csv')
+        items = [{'name': 'a', 'value': 1}, {'name': 'b, c', 'value': 2}]
+
+        result = items > to_csv(str(path), (X['name'], X['value']), header=('name', 'value'))
+
+        assert result == 2
+        assert path.read_binary() == b'name,value\r\na,1\r\n"b, c",2\r\n'
+
+    def test_rows(self, tmpdir):
+        path = tmpdir.join('out.csv')
+        [(1, 2), (3, 4)] > to_csv(str(path), delimiter=';', lineterminator='\n')
+        assert path.read_binary() == b'1;2\n3;4\n'
+
+    def test_header_only(self, tmpdir):
+        path = tmpdir.join('out.csv')
+        assert ([] > to_csv(str(path), header=['a'])) == 0
+        assert path.read_binary() == b'a\r\n'
+
+
+def test_star_import_exports_only_utils():
+    namespace = {}
+    exec('from pipetools.utils import *', namespace)
+    for name in ['io', 'csv', 'pickle', 're', 'Thread', 'GzipFile', 'merge', 'reduce']:
+        assert name not in namespace
+    assert 'read_lines' in namespace and 'KEY' in namespace